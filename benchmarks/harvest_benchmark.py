@@ -0,0 +1,146 @@
+"""
+Measures the throughput and memory use of `harvest_oai` against the local OAI-PMH stand-in server (oai_server.py).
+
+The server runs in a separate process, so that the reported peak RSS is that of the harvest alone.
+The options after `--` are passed on to the server (see `python benchmarks/oai_server.py --help`).
+
+Usage:
+    python benchmarks/harvest_benchmark.py --mode gzip -- --records 50000 --latency 0.2 --error-rate 0.02
+"""
+
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from lxml import etree
+
+# Path to the project root
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+from src import harvest, http_session
+from src.compression import get_suffix, open_raw
+
+MODES = ["xml", "gzip", "zstd", "sharded", "parquet"]
+
+
+def start_server(server_args: list):
+    """Starts the stand-in server in a subprocess and returns the process and the URL of its endpoint."""
+    process = subprocess.Popen([sys.executable, str(Path(__file__).parent / "oai_server.py"), "--port", "0", *server_args],
+                               stdout=subprocess.PIPE, text=True)
+    url = process.stdout.readline().strip()
+    if not url:
+        process.kill()
+        raise RuntimeError("The OAI-PMH stand-in server did not start")
+    return process, url
+
+
+def get_server_stats(url: str) -> dict:
+    endpoint = url.rsplit("/", 2)[0]
+    return http_session.get(f"{endpoint}/stats").json()
+
+
+def get_peak_rss() -> int:
+    """Returns the peak resident set size of the current process in bytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def count_records(mode: str, path: Path) -> int:
+    """Counts the harvested records from the output of a benchmark run."""
+    if mode == "parquet":
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(path).metadata.num_rows
+    if mode == "sharded":
+        with open(path / "manifest.json", "r", encoding="utf8") as f:
+            return sum(shard["records"] for shard in json.load(f)["shards"])
+    count = 0
+    with open_raw(path) as f:
+        for event, elem in etree.iterparse(f, events=("end",), tag=harvest.OAI_RECORD_TAG):
+            count += 1
+            elem.clear()
+    return count
+
+
+def run_benchmark(url: str, mode: str, outdir: Path, max_shard_records: int = None, workers: int = 4) -> dict:
+    """Harvests the stand-in collection once in the given mode and returns the measurements."""
+    harvest.collections["benchmark"] = {
+        "title": "OAI-PMH stand-in benchmark collection",
+        "OAI-PMH": f"{url}?verb=ListRecords&set=benchmark&metadataPrefix=marc21xml",
+        "original_format": "MARC21XML",
+    }
+    compression = mode if mode in ("gzip", "zstd") else None
+    rss_before = get_peak_rss()
+    start_time = time.perf_counter()
+
+    if mode == "sharded":
+        path = outdir / "benchmark"
+        harvest.harvest_sharded(key="benchmark", savedir=path, workers=workers, verbose=False,
+                                max_shard_records=max_shard_records or harvest.MAX_SHARD_RECORDS)
+    elif mode == "parquet":
+        path = outdir / "benchmark.parquet"
+        harvest.harvest_oai(key="benchmark", savepath=None, parquet_path=str(path))
+    else:
+        path = outdir / f"benchmark{get_suffix(compression)}"
+        harvest.harvest_oai(key="benchmark", savepath=str(path))
+
+    elapsed = time.perf_counter() - start_time
+    stats = get_server_stats(url)
+    records = count_records(mode, path)
+    return {
+        "mode": mode,
+        "records": records,
+        "seconds": round(elapsed, 3),
+        "records_per_second": round(records / elapsed, 1),
+        "bytes_received": stats["bytes_sent"],
+        "megabytes_per_second": round(stats["bytes_sent"] / elapsed / 1e6, 2),
+        "requests": stats["requests"],
+        "injected_errors": stats["errors"],
+        "peak_rss_mb": round(get_peak_rss() / 1e6, 1),
+        "rss_growth_mb": round((get_peak_rss() - rss_before) / 1e6, 1),
+    }
+
+
+def parse_args(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    server_args = []
+    if "--" in argv:
+        server_args = argv[argv.index("--") + 1:]
+        argv = argv[:argv.index("--")]
+    parser = argparse.ArgumentParser(description="Benchmark harvest_oai against the local OAI-PMH stand-in server.")
+    parser.add_argument("--mode", choices=MODES, default="xml", help="how the collection is harvested")
+    parser.add_argument("--shard-records", type=int, default=None, help="maximum records per shard in sharded mode")
+    parser.add_argument("--workers", type=int, default=4, help="number of shards harvested at the same time")
+    parser.add_argument("--backoff-factor", type=float, default=None, help="retry backoff of the HTTP session")
+    parser.add_argument("--outdir", default=None, help="directory of the harvested files (default: a temporary directory)")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON, e.g. for tracking regressions")
+    args = parser.parse_args(argv)
+    return args, server_args
+
+
+if __name__ == "__main__":
+    args, server_args = parse_args()
+    if args.backoff_factor is not None:
+        http_session.configure(backoff_factor=args.backoff_factor)
+
+    server, url = start_server(server_args)
+    try:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            outdir = Path(args.outdir or tmpdir)
+            outdir.mkdir(parents=True, exist_ok=True)
+            results = run_benchmark(url, args.mode, outdir, max_shard_records=args.shard_records, workers=args.workers)
+    finally:
+        server.terminate()
+        server.wait()
+
+    if args.json:
+        print(json.dumps(results))
+    else:
+        print()
+        for name, value in results.items():
+            print(f"{name:>22}: {value}")
@@ -0,0 +1,292 @@
+"""
+A local OAI-PMH stand-in for the Repox endpoint of data.digar.ee, used to benchmark and test the harvesting offline.
+
+The server answers Identify and ListRecords requests (with `from`/`until` datestamps and Repox-style resumptionTokens)
+from either synthetic MARC21XML records or the records of a fixture file, e.g. a previously harvested data/raw/<key>.xml.
+Latency, page size and injected errors can be configured to reproduce the behaviour of the real endpoint.
+
+Usage:
+    python benchmarks/oai_server.py --records 20000 --page-size 250 --latency 0.2 --error-rate 0.05
+"""
+
+import argparse
+import bisect
+import json
+import random
+import threading
+import time
+from datetime import date, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from lxml import etree
+
+OAI_RECORD_TAG = "{http://www.openarchives.org/OAI/2.0/}record"
+OAI_LISTRECORDS_TAG = "{http://www.openarchives.org/OAI/2.0/}ListRecords"
+OAI_DATESTAMP_TAG = "{http://www.openarchives.org/OAI/2.0/}datestamp"
+
+EARLIEST_DATESTAMP = date(2000, 1, 1)
+RESPONSE_DATE = "2024-01-01T00:00:00Z"
+
+OAI_START = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+             '<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+             'xsi:schemaLocation="http://www.openarchives.org/OAI/2.0/ http://www.openarchives.org/OAI/2.0/OAI-PMH.xsd">\n'
+             f'<responseDate>{RESPONSE_DATE}</responseDate>\n')
+OAI_END = '</OAI-PMH>\n'
+
+
+def synthetic_record(i: int, datestamp: str, deleted: bool = False) -> bytes:
+    """
+    Returns a serialized OAI-PMH record with a synthetic MARC21XML book record, shaped like the records of the ENB.
+    """
+    identifier = f"oai:andmed.digar.ee:erb:b{i:07d}"
+    if deleted:
+        return (f'<record><header status="deleted"><identifier>{identifier}</identifier>'
+                f'<datestamp>{datestamp}</datestamp></header></record>\n').encode()
+    year = 1800 + i % 224
+    return f'''<record><header><identifier>{identifier}</identifier><datestamp>{datestamp}</datestamp><setSpec>erb</setSpec></header><metadata>
+<marc:record xmlns:marc="http://www.loc.gov/MARC21/slim">
+<marc:leader>00000nam a2200000 i 4500</marc:leader>
+<marc:controlfield tag="001">b{i:07d}</marc:controlfield>
+<marc:controlfield tag="008">{datestamp[2:4]}{datestamp[5:7]}{datestamp[8:10]}s{year}    et            000 1 est d</marc:controlfield>
+<marc:datafield tag="040" ind1=" " ind2=" "><marc:subfield code="a">ErRR</marc:subfield><marc:subfield code="b">est</marc:subfield></marc:datafield>
+<marc:datafield tag="041" ind1="0" ind2=" "><marc:subfield code="a">est</marc:subfield></marc:datafield>
+<marc:datafield tag="100" ind1="1" ind2=" "><marc:subfield code="a">Tamm, Jaan{i % 97},</marc:subfield><marc:subfield code="d">{year - 40}-{year + 20}</marc:subfield><marc:subfield code="e">autor.</marc:subfield><marc:subfield code="0">(viaf){100000 + i % 997}</marc:subfield></marc:datafield>
+<marc:datafield tag="245" ind1="1" ind2="0"><marc:subfield code="a">Raamat number {i} :</marc:subfield><marc:subfield code="b">jutustus /</marc:subfield><marc:subfield code="c">Jaan Tamm.</marc:subfield></marc:datafield>
+<marc:datafield tag="250" ind1=" " ind2=" "><marc:subfield code="a">{i % 3 + 1}. tr.</marc:subfield></marc:datafield>
+<marc:datafield tag="264" ind1=" " ind2="1"><marc:subfield code="a">{("Tartu", "Tallinn", "Pärnu", "Viljandi")[i % 4]} :</marc:subfield><marc:subfield code="b">Kirjastus {i % 31},</marc:subfield><marc:subfield code="c">{year}.</marc:subfield></marc:datafield>
+<marc:datafield tag="300" ind1=" " ind2=" "><marc:subfield code="a">{50 + i % 400} lk. ;</marc:subfield><marc:subfield code="c">21 cm.</marc:subfield></marc:datafield>
+<marc:datafield tag="650" ind1=" " ind2="4"><marc:subfield code="a">ajalugu.</marc:subfield><marc:subfield code="0">https://ems.elnet.ee/id/EMS{i % 211}</marc:subfield></marc:datafield>
+<marc:datafield tag="650" ind1=" " ind2="4"><marc:subfield code="a">kirjandus.</marc:subfield></marc:datafield>
+<marc:datafield tag="655" ind1=" " ind2="4"><marc:subfield code="a">romaanid.</marc:subfield></marc:datafield>
+</marc:record>
+</metadata></record>
+'''.encode()
+
+
+def load_fixture_records(path: str) -> list:
+    """
+    Reads the records of an OAI-PMH XML file (e.g. a raw harvest) as (datestamp, serialized record) tuples.
+    """
+    records = []
+    for event, elem in etree.iterparse(path, events=("end",), tag=OAI_RECORD_TAG, huge_tree=True):
+        if elem.getparent() is not None and elem.getparent().tag == OAI_LISTRECORDS_TAG:
+            datestamp = elem.findtext(f".//{OAI_DATESTAMP_TAG}") or EARLIEST_DATESTAMP.isoformat()
+            records.append((datestamp[:10], etree.tostring(elem, encoding="utf8")))
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+    return records
+
+
+class OAIRecordStore():
+    """
+    Holds the records served by the stand-in server, sorted by datestamp.
+
+    Args:
+        records (int): The number of records served. Fixture records are repeated if needed.
+        records_per_day (int): The number of synthetic records with the same datestamp.
+        deleted_rate (float): The share of synthetic records served as deleted.
+        fixture (str): The path of an OAI-PMH XML file whose records are served instead of synthetic ones.
+
+    Methods:
+        get(i):
+            Returns the serialized i-th record.
+
+        select(from_date, until_date):
+            Returns the indices of the records with a datestamp within [from_date, until_date].
+    """
+
+    def __init__(self, records: int = 10000, records_per_day: int = 10, deleted_rate: float = 0.0, fixture: str = None):
+        self.fixture_records = load_fixture_records(fixture) if fixture else None
+        if self.fixture_records is not None and records is None:
+            records = len(self.fixture_records)
+        self.size = records
+        self.records_per_day = records_per_day
+        self.deleted_rate = deleted_rate
+        self.datestamps = [(EARLIEST_DATESTAMP + timedelta(days=i // records_per_day)).isoformat() for i in range(records)]
+
+    def get(self, i: int) -> bytes:
+        if self.fixture_records is not None:
+            return self.fixture_records[i % len(self.fixture_records)][1]
+        deleted = self.deleted_rate > 0 and random.Random(i).random() < self.deleted_rate
+        return synthetic_record(i, self.datestamps[i], deleted=deleted)
+
+    def select(self, from_date: str = None, until_date: str = None) -> range:
+        start = 0 if from_date is None else bisect.bisect_left(self.datestamps, from_date[:10])
+        end = self.size if until_date is None else bisect.bisect_right(self.datestamps, until_date[:10])
+        return range(start, max(start, end))
+
+
+class OAIRequestHandler(BaseHTTPRequestHandler):
+    """
+    Answers OAI-PMH requests from the record store and the settings of the server.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/stats":
+            return self.send_body(200, json.dumps(self.server.get_stats()).encode(), content_type="application/json", count=False)
+        args = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if self.server.should_fail():
+            return self.send_body(503, b"Service temporarily unavailable", content_type="text/plain",
+                                  headers={"Retry-After": str(self.server.retry_after)})
+        verb = args.get("verb")
+        if verb == "Identify":
+            body = self.identify()
+        elif verb == "ListRecords":
+            body = self.list_records(args)
+        else:
+            body = self.error("badVerb", f"Illegal OAI verb: {verb}")
+        self.send_body(200, body)
+
+    def send_body(self, status: int, body: bytes, content_type: str = "text/xml; charset=utf-8", headers: dict = None,
+                  count: bool = True):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        if count:
+            self.server.count_bytes(len(body))
+
+    def request_element(self, verb: str) -> str:
+        return f'<request verb="{verb}">http://{self.server.server_address[0]}:{self.server.server_address[1]}/repox/OAIHandler</request>\n'
+
+    def error(self, code: str, message: str) -> bytes:
+        return (OAI_START + self.request_element("ListRecords") + f'<error code="{code}">{message}</error>\n' + OAI_END).encode()
+
+    def identify(self) -> bytes:
+        return (OAI_START + self.request_element("Identify")
+                + '<Identify><repositoryName>OAI-PMH stand-in</repositoryName>'
+                + '<protocolVersion>2.0</protocolVersion>'
+                + f'<earliestDatestamp>{EARLIEST_DATESTAMP.isoformat()}</earliestDatestamp>'
+                + '<deletedRecord>persistent</deletedRecord><granularity>YYYY-MM-DD</granularity></Identify>\n'
+                + OAI_END).encode()
+
+    def list_records(self, args: dict) -> bytes:
+        # Repox tokens have the form <metadataPrefix>:<set>:<from>:<until>:<completeListSize>:<cursor>
+        if "resumptionToken" in args:
+            try:
+                prefix, set_spec, from_date, until_date, total, cursor = args["resumptionToken"].split(":")
+                cursor = int(cursor)
+            except ValueError:
+                return self.error("badResumptionToken", "The value of the resumptionToken argument is invalid")
+        else:
+            prefix, set_spec = args.get("metadataPrefix", "marc21xml"), args.get("set", "")
+            from_date, until_date, cursor = args.get("from", ""), args.get("until", ""), 0
+
+        selected = self.server.store.select(from_date or None, until_date or None)
+        if len(selected) == 0:
+            return self.error("noRecordsMatch", "The combination of the values of the arguments results in an empty list")
+
+        page = selected[cursor:cursor + self.server.page_size]
+        body = (OAI_START + self.request_element("ListRecords") + "<ListRecords>\n").encode() + b"".join(self.server.store.get(i) for i in page)
+        next_cursor = cursor + len(page)
+        if next_cursor < len(selected):
+            token = f"{prefix}:{set_spec}:{from_date}:{until_date}:{len(selected)}:{next_cursor}"
+            body += f'<resumptionToken completeListSize="{len(selected)}" cursor="{cursor}">{token}</resumptionToken>\n'.encode()
+        return body + ("</ListRecords>\n" + OAI_END).encode()
+
+
+class OAIServer(ThreadingHTTPServer):
+    """
+    A threaded HTTP server answering OAI-PMH requests at http://<host>:<port>/repox/OAIHandler.
+
+    Args:
+        store (OAIRecordStore): The records served.
+        host (str), port (int): The address of the server. With port 0, a free port is chosen.
+        page_size (int): The number of records per ListRecords page.
+        latency (float): Seconds waited before answering each request.
+        error_rate (float): The share of requests answered with 503 Service Unavailable.
+        error_every (int): If given, every n-th request is answered with 503 Service Unavailable.
+        retry_after (int): The Retry-After header (in seconds) of the error responses.
+        seed (int): The seed of the random error injection.
+        verbose (bool): Whether to log every request.
+
+    Attributes:
+        url (str): The URL of the OAI-PMH endpoint.
+    """
+    daemon_threads = True
+
+    def __init__(self, store: OAIRecordStore, host: str = "127.0.0.1", port: int = 0, page_size: int = 250,
+                 latency: float = 0.0, error_rate: float = 0.0, error_every: int = None, retry_after: int = 1,
+                 seed: int = 0, verbose: bool = False):
+        super().__init__((host, port), OAIRequestHandler)
+        self.store = store
+        self.page_size = page_size
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_every = error_every
+        self.retry_after = retry_after
+        self.verbose = verbose
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.bytes_sent = 0
+        self.url = f"http://{self.server_address[0]}:{self.server_address[1]}/repox/OAIHandler"
+
+    def should_fail(self) -> bool:
+        with self.lock:
+            self.requests += 1
+            fail = ((self.error_every and self.requests % self.error_every == 0)
+                    or (self.error_rate > 0 and self.random.random() < self.error_rate))
+            if fail:
+                self.errors += 1
+            return bool(fail)
+
+    def count_bytes(self, n: int):
+        with self.lock:
+            self.bytes_sent += n
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {"requests": self.requests, "errors": self.errors, "bytes_sent": self.bytes_sent}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve synthetic or fixture records over OAI-PMH.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--records", type=int, default=None, help="number of records served (default: 10000, or all fixture records)")
+    parser.add_argument("--records-per-day", type=int, default=10, help="number of records with the same datestamp")
+    parser.add_argument("--fixture", default=None, help="OAI-PMH XML file whose records are served")
+    parser.add_argument("--page-size", type=int, default=250)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds waited before each response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 503")
+    parser.add_argument("--error-every", type=int, default=None, help="answer every n-th request with 503")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After of the 503 responses in seconds")
+    parser.add_argument("--deleted-rate", type=float, default=0.0, help="share of synthetic records served as deleted")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true")
+    return parser.parse_args(argv)
+
+
+def make_server(args) -> OAIServer:
+    records = args.records if args.records is not None or args.fixture else 10000
+    store = OAIRecordStore(records=records, records_per_day=args.records_per_day,
+                           deleted_rate=args.deleted_rate, fixture=args.fixture)
+    return OAIServer(store, host=args.host, port=args.port, page_size=args.page_size, latency=args.latency,
+                     error_rate=args.error_rate, error_every=args.error_every, retry_after=args.retry_after,
+                     seed=args.seed, verbose=args.verbose)
+
+
+if __name__ == "__main__":
+    server = make_server(parse_args())
+    # the first line is read by the benchmark to find the endpoint
+    print(server.url, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -1,13 +1,100 @@
-from src.harvest import harvest_oai, collections
-from src.convert import oai_to_dataframe
+from src.harvest import harvest_many, save_harvest_state, collections
+from src.compression import get_suffix
+from src.convert import oai_to_parquet, oai_shards_to_dataframe, merge_oai_delta, get_marc_projection, get_list_columns
+from src.schema import write_converted_parquet, write_curated_parquet
 import src.curate as curate
 from datetime import timedelta
+import pandas as pd
+from pathlib import Path
 import time
 import sys
 
+
+def harvest_and_convert(keys: list, resume: bool = False, incremental: bool = False, sharded: bool = False,
+                        compression: str = None, direct: bool = False, columns: set = None, list_columns: set = None,
+                        cache: bool = False) -> dict:
+    """
+    Harvests the collections and converts each of them to data/converted/<key>.parquet.
+    The collections are harvested concurrently and each one is converted as soon as its harvest has finished.
+    In incremental mode, only the changes since the last harvest are downloaded and merged into the existing parquet file.
+    In sharded mode, full harvests are split into datestamp windows harvested in parallel into data/raw/<key>/.
+    The raw XML files are compressed with `compression` ('gzip' or 'zstd'), if given.
+    In direct mode, full harvests are converted while harvesting and written straight to the parquet file.
+    With `columns`, only these MARC paths are converted (see `get_marc_projection`).
+    The MARC paths in `list_columns` are converted to list columns instead of "; "-joined strings (see `get_list_columns`).
+    With `cache`, the parsed records are kept in data/raw/<key>.cache.sqlite and only new or changed records
+    are parsed again in later conversions (except in direct mode).
+
+    Returns the converted dataframes per collection key.
+    """
+    suffix = get_suffix(compression)
+    jobs = {}
+    for key in keys:
+        if incremental and Path(f"data/converted/{key}.parquet").exists():
+            jobs[key] = {"savepath": f"data/raw/{key}.delta{suffix}", "resume": resume, "incremental": True}
+        elif sharded:
+            jobs[key] = {"savepath": f"data/raw/{key}", "sharded": True, "compression": compression}
+        elif direct:
+            jobs[key] = {"savepath": f"data/raw/{key}{suffix}", "parquet_path": f"data/converted/{key}.parquet",
+                         "resume": resume, "columns": columns, "list_columns": list_columns}
+        else:
+            jobs[key] = {"savepath": f"data/raw/{key}{suffix}", "resume": resume}
+
+    def convert(key, response_date):
+        converted_path = f"data/converted/{key}.parquet"
+        raw_path = jobs[key]["savepath"]
+        cache_path = f"data/raw/{key}.cache.sqlite" if cache else None
+
+        # the direct harvest has already written the converted file
+        if jobs[key].get("parquet_path"):
+            save_harvest_state(key, response_date)
+            return pd.read_parquet(converted_path)
+
+        # take the raw XML file, convert it to a dataframe and save it
+        if jobs[key].get("incremental"):
+            print(f"\nMerging changes into {key}")
+            df = merge_oai_delta(raw_path, converted_path, columns=columns, list_columns=list_columns,
+                                 cache_path=cache_path)
+            write_converted_parquet(df, converted_path)
+        elif jobs[key].get("sharded"):
+            print(f"\nConverting {key} shards to dataframe")
+            df = oai_shards_to_dataframe(f"{raw_path}/manifest.json", rename_columns=False, columns=columns,
+                                         list_columns=list_columns, cache_path=cache_path)
+            write_converted_parquet(df, converted_path)
+        else:
+            # stream the records into the parquet file, so the conversion does not need to hold the whole table in memory
+            print(f"\nConverting {key} to parquet")
+            oai_to_parquet(raw_path, converted_path, rename_columns=False, columns=columns, list_columns=list_columns,
+                           cache_path=cache_path)
+            df = pd.read_parquet(converted_path)
+
+        # the next incremental harvest starts from the date of this one
+        save_harvest_state(key, response_date)
+        return df
+
+    print(f"\nHarvesting {', '.join(collections[key]['title'] for key in keys)}")
+    return harvest_many(jobs, on_harvested=convert)
+
+
 if __name__ == "__main__":
     start_time = time.time()
     key = sys.argv[1]
+    resume = "--resume" in sys.argv[2:]
+    incremental = "--incremental" in sys.argv[2:]
+    sharded = "--sharded" in sys.argv[2:]
+    direct = "--direct" in sys.argv[2:]
+    compression = "gzip" if "--gzip" in sys.argv[2:] else "zstd" if "--zstd" in sys.argv[2:] else None
+    # only convert the MARC paths used by the curation
+    project = "--project" in sys.argv[2:]
+    collection_type = "persons" if key == "persons" else "books"
+    columns = get_marc_projection(collection_type) if project else None
+    # keep the values of repeated fields as lists instead of "; "-joined strings
+    list_columns = get_list_columns() if "--lists" in sys.argv[2:] else None
+    # reuse the records parsed in previous conversions and the outputs of unchanged curation steps
+    cache = "--cache" in sys.argv[2:]
+    cache_dir = f"data/curated/{key}.steps" if cache else None
+    # curate partitions of the dataframe in parallel processes (one per CPU, for large collections only)
+    max_workers = None if "--parallel" in sys.argv[2:] else 1
 
     valid_keys = ['enb_books'] + list(collections.keys())
 
@@ -15,66 +102,41 @@ if __name__ == "__main__":
         raise ValueError(f"Invalid collection: {key}. Valid collections are: {valid_keys}")
 
     if key == "enb_books":
-        for k in ["enb_estonian_books", "enb_non_estonian_books"]:
-            # harvest and save the raw XML file
-            print(f"\nHarvesting {collections[k]['title']}")
-            harvest_oai(key=k, savepath=f"data/raw/{k}.xml")
-
-            # take the raw XML file, convert it to a dataframe and save it
-            print(f"\nConverting {k} to dataframe")
-            df = oai_to_dataframe(f"data/raw/{k}.xml", rename_columns=False)
-            df.to_parquet(f"data/converted/{k}.parquet")
-        
+        converted = harvest_and_convert(["enb_estonian_books", "enb_non_estonian_books"], resume=resume, incremental=incremental, sharded=sharded, compression=compression, direct=direct, columns=columns, list_columns=list_columns, cache=cache)
+
         # concatenate the dataframes for cleaning
-        import pandas as pd
-        enb_est = pd.read_parquet("data/converted/enb_estonian_books.parquet")
-        enb_non = pd.read_parquet("data/converted/enb_non_estonian_books.parquet")
-        df = pd.concat([enb_est, enb_non]).reset_index(drop=True)
-        del(enb_est, enb_non) # free up RAM
-        df.to_parquet(f"data/converted/{key}.parquet")
+        df = pd.concat(converted.values()).reset_index(drop=True)
+        del(converted) # free up RAM
+        write_converted_parquet(df, f"data/converted/{key}.parquet")
 
         # clean and filter the converted dataframe
         print("\nCleaning dataframe")
-        df = curate.curate_books(df)
+        df = curate.curate_books(df, max_workers=max_workers, cache_dir=cache_dir)
         df = curate.organize_columns(df, collection_type="books")
-        df.to_parquet(f"data/curated/{key}.parquet")
-        
+        write_curated_parquet(df, f"data/curated/{key}.parquet", collection_type="books")
 
-    elif key == "persons":
-        # harvest and save the raw XML file
-        print(f"\nHarvesting {collections[key]['title']}")
-        harvest_oai(key=key, savepath=f"data/raw/{key}.xml")
 
-        # take the raw XML file, convert it to a dataframe and save it
-        print(f"\nConverting {key} to dataframe")
-        df = oai_to_dataframe(f"data/raw/{key}.xml", rename_columns=False)
-        df.to_parquet(f"data/converted/{key}.parquet")
+    elif key == "persons":
+        df = harvest_and_convert([key], resume=resume, incremental=incremental, sharded=sharded, compression=compression, direct=direct, columns=columns, list_columns=list_columns, cache=cache)[key]
 
         # clean and filter the converted dataframe
         print("\nCleaning dataframe")
-        df = curate.curate_persons(df)
+        df = curate.curate_persons(df, max_workers=max_workers, cache_dir=cache_dir)
         df = curate.organize_columns(df, collection_type="persons")
-        df.to_parquet(f"data/curated/{key}.parquet")
+        write_curated_parquet(df, f"data/curated/{key}.parquet", collection_type="persons")
 
     else:
-        # harvest and save the raw XML file
-        print(f"\nHarvesting {collections[key]['title']}")
-        harvest_oai(key=key, savepath=f"data/raw/{key}.xml")
-
-        # take the raw XML file, convert it to a dataframe and save it
-        print(f"\nConverting {key} to dataframe")
-        df = oai_to_dataframe(f"data/raw/{key}.xml", rename_columns=False)
-        df.to_parquet(f"data/converted/{key}.parquet")
+        df = harvest_and_convert([key], resume=resume, incremental=incremental, sharded=sharded, compression=compression, direct=direct, columns=columns, list_columns=list_columns, cache=cache)[key]
 
         # clean and filter the converted dataframe
         print("\nProcessing dataframe")
         print("Warning: some of the columns in this collection do not yet have custom cleaning functions. Cleaning will proceed as if the collection were 'enb_books', but the result may be partially incorrect. Please check 'curate.py' for reference.")
-        df = curate.curate_books(df)
+        df = curate.curate_books(df, max_workers=max_workers, cache_dir=cache_dir)
         df = curate.organize_columns(df, collection_type="books")
-        df.to_parquet(f"data/curated/{key}.parquet")
+        write_curated_parquet(df, f"data/curated/{key}.parquet", collection_type="books")
         # df.to_csv(f"data/curated/{key}.tsv", sep="\t", encoding="utf8", index=False)
 
     end_time = time.time()
     elapsed_time = end_time - start_time  # Calculate the elapsed time
     formatted_time = str(timedelta(seconds=elapsed_time))  # Format the elapsed time
-    print(f"\nCompleted in {formatted_time}")
\ No newline at end of file
+    print(f"\nCompleted in {formatted_time}")
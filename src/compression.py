@@ -0,0 +1,134 @@
+import gzip
+import os
+from pathlib import Path
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Compression formats of raw files, detected from the file suffix
+COMPRESSION_SUFFIXES = {
+    ".gz": "gzip",
+    ".zst": "zstd",
+}
+
+
+def get_compression(path) -> str:
+    """Returns the compression format of a raw file ('gzip', 'zstd' or None) based on its suffix."""
+    return COMPRESSION_SUFFIXES.get(Path(path).suffix.lower())
+
+
+def get_suffix(compression: str = None) -> str:
+    """Returns the suffix of a raw XML file stored with the given compression format."""
+    if compression is None:
+        return ".xml"
+    for suffix, format in COMPRESSION_SUFFIXES.items():
+        if format == compression:
+            return ".xml" + suffix
+    raise ValueError(f"Unsupported compression: {compression}. Supported formats are: {list(COMPRESSION_SUFFIXES.values())}")
+
+
+def is_xml_path(path) -> bool:
+    """Checks whether a path points to an XML file, possibly compressed (e.g. 'enb.xml.gz')."""
+    path = Path(path)
+    if get_compression(path) is not None:
+        path = path.with_suffix("")
+    return path.suffix.lower() == ".xml"
+
+
+def require_zstandard():
+    if zstandard is None:
+        raise ImportError("Reading and writing .zst files requires the 'zstandard' package (pip install zstandard)")
+
+
+def open_raw(path, mode: str = "rb"):
+    """
+    Opens a raw file for reading in binary mode, decompressing it on the fly if it is compressed.
+    """
+    if mode != "rb":
+        raise ValueError("open_raw only supports reading, use RawFileWriter for writing")
+    compression = get_compression(path)
+    if compression == "gzip":
+        return gzip.open(path, "rb")
+    elif compression == "zstd":
+        require_zstandard()
+        return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), read_across_frames=True, closefd=True)
+    return open(path, "rb")
+
+
+class RawFileWriter():
+    """
+    Writes a raw file, compressing it on the fly according to its suffix.
+
+    Compressed output is written as a sequence of independent gzip members or zstd frames, one per commit.
+    This keeps the file readable as a whole while allowing it to be truncated at any committed offset
+    (e.g. when resuming an interrupted harvest).
+
+    Args:
+        path (str): The path of the file. If None, all writes are discarded (used when the raw file is not kept).
+        offset (int): If given, the existing file is truncated to this (committed) offset and appended to.
+
+    Methods:
+        write(data):
+            Writes bytes to the file.
+
+        commit():
+            Finishes the current member/frame, flushes the file to disk and returns the committed offset.
+
+        close():
+            Commits and closes the file.
+    """
+
+    def __init__(self, path, offset: int = None):
+        self.stream = None
+        if path is None:
+            self.file = None
+            return
+        self.compression = get_compression(path)
+        if self.compression == "zstd":
+            require_zstandard()
+        if offset is None:
+            self.file = open(path, "wb")
+        else:
+            self.file = open(path, "r+b")
+            self.file.truncate(offset)
+            self.file.seek(offset)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, data: bytes):
+        if self.file is None:
+            return
+        if self.compression is None:
+            self.file.write(data)
+            return
+        if self.stream is None:
+            if self.compression == "gzip":
+                self.stream = gzip.GzipFile(fileobj=self.file, mode="wb")
+            else:
+                self.stream = zstandard.ZstdCompressor().stream_writer(self.file, closefd=False)
+        self.stream.write(data)
+
+    def commit(self) -> int:
+        if self.file is None:
+            return 0
+        if self.stream is not None:
+            # closing the member/frame writes its trailer without closing the underlying file
+            if self.compression == "gzip":
+                self.stream.close()
+            else:
+                self.stream.flush(zstandard.FLUSH_FRAME)
+            self.stream = None
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return self.file.tell()
+
+    def close(self):
+        if self.file is not None and not self.file.closed:
+            self.commit()
+            self.file.close()
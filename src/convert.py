@@ -3,13 +3,31 @@ from pymarc.record import Record
 from pymarc.marcxml import XmlHandler, MARC_XML_NS
 from lxml import etree
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from pathlib import Path
+import shutil
 import json
 import re
-import io
 from tqdm import tqdm
-import multiprocessing
-from concurrent.futures import ProcessPoolExecutor, as_completed
+import os
+import mmap
+from collections import deque
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+
+if __name__ == "__main__" or not __package__:
+    # when using this script (or another script importing it) from command line
+    from compression import open_raw, is_xml_path, RawFileWriter
+    from record_index import can_index, get_record_index, stream_records
+    from record_cache import RecordCache, get_record_hash, get_record_identifier
+    from schema import get_converted_schema, COMPRESSION, ROW_GROUP_SIZE
+else:
+    # when using the conversion functions as imported
+    from src.compression import open_raw, is_xml_path, RawFileWriter
+    from src.record_index import can_index, get_record_index, stream_records
+    from src.record_cache import RecordCache, get_record_hash, get_record_identifier
+    from src.schema import get_converted_schema, COMPRESSION, ROW_GROUP_SIZE
 
 # Path to the current script
 current_script_path = Path(__file__)
@@ -21,6 +39,17 @@ read_data_path = project_root / "data" / "raw"
 write_data_path = project_root / "data" / "converted"
 # Path to the collections.json file in the config directory
 column_names_file_path = project_root / "config" / "marc_columns_dict.json"
+# Paths to the lists of columns used by the curation script
+columns_to_keep_file_path = project_root / "config" / "marc_columns_to_keep.json"
+column_order_file_path = project_root / "config" / "marc_columns_order.json"
+# Path to the list of repeatable MARC paths that can be converted to list columns
+list_columns_file_path = project_root / "config" / "marc_list_columns.json"
+
+# Number of records parsed by a worker process at a time in marc_to_dataframe
+CHUNK_SIZE = 2000
+
+# Version of the record parsers, to be increased whenever their output changes so that cached records are parsed again
+PARSER_VERSION = 1
 
 with open(column_names_file_path, "r", encoding="utf8") as f:
     marc_columns_dict = json.load(f)
@@ -68,13 +97,21 @@ class MARCrecordParser():
     A class to parse a MARC record and extract the fields and subfields.
 
     Args:
-        record (Record): A MARC record.
+        record (Record | dict): A MARC record, or its dictionary form as returned by `Record.as_dict()`
+            or `marcxml_element_to_dict()`.
+        columns (set): If given, only these MARC paths (e.g. "245$a", or "100" for the combined person fields)
+            are extracted, see `get_marc_projection()`.
+        list_columns (set): The MARC paths whose values are returned as lists of the values of the repeated fields
+            instead of strings joined with `duplicate_field_sep`, see `get_list_columns()`.
 
     Attributes:
         fields (list): A list of fields in the MARC record.
         marc_paths (dict): A dictionary of the paths and values of the fields in the MARC record.
         duplicate_field_sep (str): A separator for duplicate fields.
         return_control_fields (bool): Whether or not to return control fields.
+        columns (set): The MARC paths to extract, or None for all paths.
+        field_tags (set): The field tags of the MARC paths to extract, or None for all fields.
+        list_columns (set): The MARC paths returned as lists.
 
     Methods:
         join_subfields_list(subfields_list):
@@ -99,11 +136,14 @@ class MARCrecordParser():
             Parse the fields in the MARC record and return a dictionary of the paths and values of the fields.
     """
 
-    def __init__(self, record: Record, duplicate_field_sep: str = "; "):
-        self.fields = record.as_dict()["fields"]
+    def __init__(self, record: Record, duplicate_field_sep: str = "; ", columns: set = None, list_columns: set = None):
+        self.fields = record["fields"] if isinstance(record, dict) else record.as_dict()["fields"]
         self.marc_paths = {}
         self.duplicate_field_sep = "; "
         self.return_control_fields = True
+        self.columns = columns
+        self.field_tags = None if columns is None else {column.split("$")[0] for column in columns}
+        self.list_columns = list_columns or set()
 
     def join_subfields_list(self, subfields_list: list):
         subfields = {}
@@ -194,7 +234,9 @@ class MARCrecordParser():
                 value = self.clean_field(value)
             except IndexError:
                 pass
-            if field not in self.marc_paths.keys():
+            if field in self.list_columns:
+                self.marc_paths.setdefault(field, []).append(value)
+            elif field not in self.marc_paths.keys():
                 self.marc_paths[field] = value
             else:
                 self.marc_paths[field] += self.duplicate_field_sep + value
@@ -209,6 +251,9 @@ class MARCrecordParser():
             if path[0] == "9":
                 # skip these fields - not needed in ENB
                 pass
+            elif self.field_tags is not None and path not in self.field_tags:
+                # skip the fields that are not projected
+                pass
             else:
                 if isinstance(value, dict):
                     subfields = self.join_subfields_list(value["subfields"])
@@ -216,28 +261,33 @@ class MARCrecordParser():
                     if path in ["100", "600", "700"]:
                         # person fields exception
                         person_string = self.handle_person_subfields(subfields)
-                        self.append_field(path, person_string)
+                        if self.columns is None or path in self.columns:
+                            self.append_field(path, person_string)
 
                     elif path in ["710"]:
                         # corporate field exception
                         corporate_string = self.handle_corporate_subfields(subfields)
-                        self.append_field(path, corporate_string)
+                        if self.columns is None or path in self.columns:
+                            self.append_field(path, corporate_string)
 
                     elif path in ["650", "651", "655"]:
                         # keyword fields exception
                         keyword_string = self.handle_keyword_subfields(subfields)
-                        self.append_field(path, keyword_string)
+                        if self.columns is None or path in self.columns:
+                            self.append_field(path, keyword_string)
 
                     elif path in ["246"]:
                         # title varform exception
                         title_varform_string = self.handle_title_varform_subfields(subfields)
-                        self.append_field(path, title_varform_string)
+                        if self.columns is None or path in self.columns:
+                            self.append_field(path, title_varform_string)
 
                     else:
                         # standard approach for all other fields
                         for key, subval in subfields.items():
                             subpath = path + "$" + key
-                            self.append_field(subpath, subval)
+                            if self.columns is None or subpath in self.columns:
+                                self.append_field(subpath, subval)
 
                 elif isinstance(value, str):
                     # control fields
@@ -268,6 +318,12 @@ class DCrecordParser():
             Parses the Dublin Core fields in the EDM record and returns them as a dictionary.
     """
 
+    # date formats from which a year is extracted, compiled once for all records
+    year_patterns = [re.compile(r"(^([\D\s]+)(\d{4})([\D\s]*)$)|(^([\D\s]*)(\d{4})([\D\s]+)$)"),
+                     re.compile(r"^\d{4}-\d{2}-\d{2}$"),
+                     re.compile(r"^\d{2}-\d{2}-\d{4}$"),
+                     re.compile(r"^\d{4}-\d{2}$")]
+    year_digits_pattern = re.compile(r"\d{4}")
 
     def __init__(self, record: etree._ElementTree):
         self.namespaces = {"xsi": "http://www.w3.org/2001/XMLSchema-instance",
@@ -290,13 +346,9 @@ class DCrecordParser():
                 return int(date)
             else:
                 return None
-        patterns = [re.compile(r"(^([\D\s]+)(\d{4})([\D\s]*)$)|(^([\D\s]*)(\d{4})([\D\s]+)$)"),
-                    re.compile(r"^\d{4}-\d{2}-\d{2}$"),
-                    re.compile(r"^\d{2}-\d{2}-\d{4}$"),
-                    re.compile(r"^\d{4}-\d{2}$")]
-        for pattern in patterns:
-            if re.match(pattern, date):
-                date = re.findall(r"\d{4}", date)[0]
+        for pattern in self.year_patterns:
+            if pattern.match(date):
+                date = self.year_digits_pattern.findall(date)[0]
         if len(date) == 4:
             try:
                 date = int(date)
@@ -338,17 +390,158 @@ class DCrecordParser():
         return self.dc_fields
     
 
+class ParquetRecordSink():
+    """
+    Writes parsed records (dictionaries) to a parquet file in batches, without holding all records in memory.
+
+    Each batch of `batch_size` records is written to a temporary part file as soon as it is full. Since new
+    columns (e.g. MARC paths) can appear in any batch, the schemas of the parts are unified when the sink is
+    closed and the parts are copied into the final file, filling the missing columns with nulls. The final file
+    has the converted schema (see `schema.get_converted_schema`) and row groups of up to `row_group_size` rows.
+
+    The parts written so far can be committed (see `commit`), e.g. together with the checkpoint of a harvest.
+    A sink opened with the committed state continues from there, discarding the parts written after the commit.
+
+    Args:
+        path (str): The path of the output parquet file.
+        batch_size (int): The number of records per batch (and temporary part file).
+        row_group_size (int): The number of rows per row group of the output file.
+        resume_state (dict): The state returned by `commit` to continue from, or None to start anew.
+        resumable (bool): Whether to keep the parts if the sink is closed by an error, so that it can be resumed.
+
+    Methods:
+        write(record):
+            Adds a record to the current batch, writing the batch out when it is full.
+
+        commit():
+            Writes the current batch and returns the state of the sink (its parts, columns and number of rows).
+
+        close():
+            Writes the last batch, assembles the parquet file and returns the number of rows written.
+    """
+
+    def __init__(self, path, batch_size: int = 10000, row_group_size: int = ROW_GROUP_SIZE, resume_state: dict = None,
+                 resumable: bool = False):
+        self.path = Path(path)
+        self.batch_size = batch_size
+        self.row_group_size = row_group_size
+        self.resumable = resumable
+        self.parts_dir = Path(f"{path}.parts")
+        self.batch = []
+        if resume_state is None:
+            # parts left over by an earlier, interrupted sink are discarded
+            shutil.rmtree(self.parts_dir, ignore_errors=True)
+            self.parts = []
+            # columns in the order of their first appearance, like pd.DataFrame.from_records
+            self.columns = {}
+            self.num_rows = 0
+        else:
+            self.parts = [self.parts_dir / name for name in resume_state["parts"]]
+            missing = [part.name for part in self.parts if not part.exists()]
+            if missing:
+                raise ValueError(f"Cannot resume {path}, the committed parts {missing} are missing")
+            # parts written after the commit are discarded
+            for part in self.parts_dir.glob("part_*.parquet"):
+                if part not in self.parts:
+                    part.unlink()
+            self.columns = dict.fromkeys(resume_state["columns"])
+            self.num_rows = resume_state["num_rows"]
+        self.parts_dir.mkdir(parents=True, exist_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        elif not self.resumable:
+            shutil.rmtree(self.parts_dir, ignore_errors=True)
+
+    def write(self, record: dict):
+        self.batch.append(record)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.batch:
+            return
+        batch_columns = {}
+        for record in self.batch:
+            for column in record:
+                batch_columns.setdefault(column, None)
+        self.columns.update(batch_columns)
+        table = pa.table({column: [record.get(column) for record in self.batch] for column in batch_columns})
+        part_path = self.parts_dir / f"part_{len(self.parts):05d}.parquet"
+        pq.write_table(table, part_path)
+        self.parts.append(part_path)
+        self.num_rows += len(self.batch)
+        self.batch = []
+
+    def commit(self) -> dict:
+        self.flush()
+        return {"parts": [part.name for part in self.parts], "columns": list(self.columns), "num_rows": self.num_rows}
+
+    def close(self) -> int:
+        self.flush()
+        schemas = [pq.read_schema(part) for part in self.parts]
+        schema = pa.unify_schemas(schemas, promote_options="permissive") if schemas else pa.schema([])
+        # columns that were null in every record have no type, they are stored as strings
+        schema = get_converted_schema(pa.schema([schema.field(column) for column in self.columns]))
+
+        with pq.ParquetWriter(self.path, schema, compression=COMPRESSION) as writer:
+            # the parts are collected into row groups of up to row_group_size rows
+            tables, num_rows = [], 0
+            for part in self.parts:
+                table = pq.read_table(part)
+                columns = [table[field.name].cast(field.type) if field.name in table.column_names
+                           else pa.nulls(len(table), type=field.type) for field in schema]
+                tables.append(pa.Table.from_arrays(columns, schema=schema))
+                num_rows += len(table)
+                if num_rows >= self.row_group_size:
+                    writer.write_table(pa.concat_tables(tables), row_group_size=self.row_group_size)
+                    tables, num_rows = [], 0
+            if tables:
+                writer.write_table(pa.concat_tables(tables), row_group_size=self.row_group_size)
+        shutil.rmtree(self.parts_dir, ignore_errors=True)
+        return self.num_rows
+
+
+def get_marc_projection(collection_type: str = None) -> set:
+    """
+    Returns the MARC paths used downstream, to be extracted when converting with a projection (`columns`):
+    the columns in config/marc_columns_to_keep.json and the MARC paths of the columns that `curate.organize_columns`
+    keeps for the collection type ('books' or 'persons', or all types if None) in config/marc_columns_order.json.
+    """
+    with open(columns_to_keep_file_path, "r", encoding="utf8") as f:
+        columns = set(json.load(f)["columns"])
+    with open(column_order_file_path, "r", encoding="utf8") as f:
+        column_order = json.load(f)
+    collection_types = column_order.keys() if collection_type is None else [collection_type]
+    kept_names = {name for collection_type in collection_types for name in column_order[collection_type]}
+    columns.update(path for path, name in marc_columns_dict.items() if name in kept_names or path in kept_names)
+    return columns
+
+
+def get_list_columns() -> set:
+    """
+    Returns the repeatable MARC paths in config/marc_list_columns.json, to be converted to list columns (`list_columns`)
+    instead of strings joined with "; ". These are the repeated fields that the curation splits into their values.
+    """
+    with open(list_columns_file_path, "r", encoding="utf8") as f:
+        return set(json.load(f)["columns"])
+
+
 def register_namespaces():
     for key, value in get_namespaces().items():
         etree.register_namespace(key, value)
 
 
 def read_marc_records(filepath):
-    if filepath[-4:] != ".xml":
+    if not is_xml_path(filepath):
         raise ValueError("Filepath must be in XML format")
     else:
         handler = MyContentHandler()
-        with open(filepath, "r", encoding="utf8") as f:
+        with open_raw(filepath) as f:
             parse_xml(f, handler=handler)
         marc_records = handler.records
         marc_records = [record for record in marc_records if record is not None]
@@ -361,8 +554,9 @@ def read_edm_records(source):
     Output: list"""
 
     if isinstance(source, str):
-        if source.lower().endswith(".xml"):
-            tree = etree.parse(source)
+        if is_xml_path(source):
+            with open_raw(source) as f:
+                tree = etree.parse(f)
         else:
             raise ValueError("Invalid path to file. Must be in .xml format.")
     elif isinstance(source, etree._ElementTree):
@@ -376,49 +570,435 @@ def read_edm_records(source):
     return records
 
 
-def parse_marcxml_record(record_xml):
-    handler = MyContentHandler()
-    record_xml_file = io.StringIO(record_xml)  # Convert the XML string to a file-like object
-    parse_xml(record_xml_file, handler=handler)
-    if handler.records:
-        record = handler.records[0]
-        return MARCrecordParser(record).parse()
-    return {}
+# Leader of a record without a leader element, as set by pymarc
+EMPTY_MARC_LEADER = str(Record().leader)
 
 
-def parse_record_with_queue(record_xml, queue):
-    result = parse_marcxml_record(record_xml)
-    queue.put(1)
-    return result
+def normalize_marc_tag(tag: str) -> str:
+    """Pads a field tag to three characters, like pymarc.Field."""
+    try:
+        return "%03i" % int(tag)
+    except (TypeError, ValueError):
+        return "%03s" % tag
 
-def read_marc_records_stream(filepath):
-    context = etree.iterparse(filepath, events=("end",), tag="{http://www.loc.gov/MARC21/slim}record")
-    for event, elem in context:
-        record_xml = etree.tostring(elem, encoding="unicode")
-        elem.clear()
+
+def is_control_tag(tag: str) -> bool:
+    """Checks whether a (normalized) field tag belongs to a control field, like pymarc.Field.is_control_field."""
+    return tag < "010" and tag.isdigit()
+
+
+def get_element_text(elem) -> str:
+    """Returns the character data of an element the way the pymarc SAX handler collects it."""
+    # the handler resets the collected text at the start and end of every child element (but not at comments),
+    # so only the text after the last child element remains
+    text = elem.text or ""
+    if not len(elem):
+        return text
+    for child in elem:
+        if isinstance(child.tag, str):
+            text = child.tail or ""
+        else:
+            text += child.tail or ""
+    return text
+
+
+def marcxml_element_to_dict(record) -> dict:
+    """
+    Converts a MARC21XML record element into the dictionary form of a pymarc record (see `pymarc.Record.as_dict`),
+    without building the intermediate pymarc objects.
+
+    The result matches parsing the serialized record with `MyContentHandler` and calling `as_dict()`, including its
+    handling of coding errors in the data: datafields with a control field tag become empty control fields.
+    """
+    leader = EMPTY_MARC_LEADER
+    fields = []
+    for elem in record.iterchildren(tag=etree.Element):
+        element = elem.tag.rpartition("}")[2]
+        if element == "leader":
+            leader = get_element_text(elem)
+        elif element == "controlfield":
+            fields.append({normalize_marc_tag(elem.get("tag")): get_element_text(elem)})
+        elif element == "datafield":
+            tag = normalize_marc_tag(elem.get("tag"))
+            if is_control_tag(tag):
+                fields.append({tag: ""})
+                continue
+            subfields = [{subfield.get("code"): get_element_text(subfield)} for subfield in elem.iterchildren(tag=etree.Element)
+                         if subfield.tag.rpartition("}")[2] == "subfield"]
+            fields.append({tag: {"subfields": subfields, "ind1": elem.get("ind1", " "), "ind2": elem.get("ind2", " ")}})
+    return {"leader": leader, "fields": fields}
+
+
+def parse_marcxml_element(record, columns: set = None, list_columns: set = None) -> dict:
+    """
+    Parses a MARC21XML record element into a flat dictionary of MARC paths and values (only `columns`, if given).
+    The values of the paths in `list_columns` are lists of the values of the repeated fields.
+    """
+    return MARCrecordParser(marcxml_element_to_dict(record), columns=columns, list_columns=list_columns).parse()
+
+
+def parse_marcxml_record(record_xml, columns: set = None, list_columns: set = None):
+    """Parses a serialized MARC21XML record (str or bytes) into a flat dictionary of MARC paths and values."""
+    record = etree.fromstring(record_xml)
+    if etree.QName(record).localname != "record":
+        record = next(record.iter("{*}record"), None)
+        if record is None:
+            return {}
+    return parse_marcxml_element(record, columns=columns, list_columns=list_columns)
+
+
+def parse_oai_record(record_xml, columns: set = None, list_columns: set = None) -> dict:
+    """
+    Parses a single serialized OAI-PMH record (MARC21XML or EDM) into a flat dictionary.
+    Returns None for records without metadata (e.g. deleted records).
+    With `columns`, only these MARC paths are extracted from MARC21XML records, and the paths in `list_columns`
+    are returned as lists.
+    """
+    return parse_oai_record_element(etree.fromstring(record_xml), columns=columns, list_columns=list_columns)
+
+
+def parse_oai_record_element(record, columns: set = None, list_columns: set = None) -> dict:
+    """Parses an OAI-PMH record element (MARC21XML or EDM) into a flat dictionary, or returns None if it has no metadata."""
+    ns = get_namespaces()
+    marc_record = record.find("./oai:metadata/marc:record", namespaces=ns)
+    if marc_record is not None:
+        return parse_marcxml_element(marc_record, columns=columns, list_columns=list_columns)
+    if record.find("./oai:metadata/rdf:RDF/edm:ProvidedCHO", namespaces=ns) is not None:
+        return DCrecordParser(record).parse()
+    return None
+
+
+def parse_marcxml_records(records_xml, columns: set = None, list_columns: set = None):
+    return [parse_marcxml_record(record_xml, columns=columns, list_columns=list_columns) for record_xml in records_xml]
+
+
+def parse_edm_record(record_xml) -> dict:
+    return DCrecordParser(etree.fromstring(record_xml)).parse()
+
+
+def parse_edm_records(records_xml):
+    return [parse_edm_record(record_xml) for record_xml in records_xml]
+
+
+def parse_record_element(record, columns: set = None, list_columns: set = None) -> dict:
+    """Parses a top-level record of a raw file, either an OAI-PMH record or a MARC21XML record."""
+    if record.tag == "{http://www.loc.gov/MARC21/slim}record":
+        return parse_marcxml_element(record, columns=columns, list_columns=list_columns)
+    return parse_oai_record_element(record, columns=columns, list_columns=list_columns)
+
+
+def parse_record_ranges(filepath, root_start: bytes, root_end: bytes, ranges, columns: set = None, list_columns: set = None) -> list:
+    """
+    Parses the records at the given (start, end) byte offsets of an uncompressed raw file (see `record_index`).
+    Each record is wrapped in the root element of the file, so that the namespace declarations of the root apply.
+    """
+    with open(filepath, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return [parse_record_element(etree.fromstring(root_start + mm[start:end] + root_end)[0], columns=columns, list_columns=list_columns)
+                for start, end in ranges.tolist()]
+
+
+def get_parser_key(columns: set = None, list_columns: set = None) -> str:
+    """Returns the parser version and the options that the parsed records depend on, which key the record cache."""
+    return json.dumps([PARSER_VERSION, sorted(columns) if columns is not None else None, sorted(list_columns or [])])
+
+
+def parse_records_cached(records_xml, parse, cache_path, parser_key, prefix: bytes = b"") -> list:
+    """
+    Parses serialized records with `parse`, reusing the records found in the record cache with an unchanged hash
+    (see `record_cache.RecordCache`). Returns (record, cache entry) pairs, where the cache entry of a newly parsed
+    record is to be stored by the caller, and is None for a cached record.
+    """
+    results = []
+    with RecordCache(cache_path, parser_key, readonly=True) as cache:
+        for record_xml in records_xml:
+            record_hash = get_record_hash(record_xml, prefix)
+            identifier = get_record_identifier(record_xml) or record_hash.hex()
+            record = cache.lookup(identifier, record_hash)
+            if record is not None:
+                results.append((record, None))
+            else:
+                record = parse(record_xml)
+                results.append((record, (identifier, record_hash, record)))
+    return results
+
+
+def parse_wrapped_record(record_xml: bytes, root_start: bytes, root_end: bytes, columns: set = None, list_columns: set = None) -> dict:
+    """Parses the bytes of a top-level record of a raw file, wrapped in the root element of the file."""
+    return parse_record_element(etree.fromstring(root_start + record_xml + root_end)[0], columns=columns, list_columns=list_columns)
+
+
+def parse_record_ranges_cached(filepath, root_start: bytes, root_end: bytes, ranges, cache_path, parser_key,
+                               columns: set = None, list_columns: set = None) -> list:
+    """Parses the records at the given byte offsets of an uncompressed raw file like `parse_record_ranges`, reusing cached records."""
+    parse = partial(parse_wrapped_record, root_start=root_start, root_end=root_end, columns=columns, list_columns=list_columns)
+    with open(filepath, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        records_xml = [mm[start:end] for start, end in ranges.tolist()]
+    return parse_records_cached(records_xml, parse, cache_path, parser_key, prefix=root_start)
+
+
+def parse_streamed_records_cached(records, cache_path, parser_key, columns: set = None, list_columns: set = None) -> list:
+    """
+    Parses the (root start tag, root end tag, record bytes) tuples read by `record_index.stream_records`, reusing cached
+    records. The records are keyed like those of `parse_record_ranges_cached`, so the cache is shared between the
+    compressed and the uncompressed copies of a file.
+    """
+    root_start, root_end = records[0][0], records[0][1]
+    parse = partial(parse_wrapped_record, root_start=root_start, root_end=root_end, columns=columns, list_columns=list_columns)
+    return parse_records_cached([record_xml for _, _, record_xml in records], parse, cache_path, parser_key, prefix=root_start)
+
+
+def record_element_to_dict(record) -> dict:
+    """
+    Converts a top-level record of a raw file (an OAI-PMH record or a MARC21XML record) into the form used by
+    `oai_to_dict`: the dictionary form of a pymarc record for MARC21XML, or the Dublin Core fields for EDM.
+    Returns None for records without metadata.
+    """
+    if record.tag == "{http://www.loc.gov/MARC21/slim}record":
+        return marcxml_element_to_dict(record)
+    ns = get_namespaces()
+    marc_record = record.find("./oai:metadata/marc:record", namespaces=ns)
+    if marc_record is not None:
+        return marcxml_element_to_dict(marc_record)
+    if record.find("./oai:metadata/rdf:RDF/edm:ProvidedCHO", namespaces=ns) is not None:
+        return DCrecordParser(record).parse()
+    return None
+
+
+def to_json_line(record: dict) -> bytes:
+    return (json.dumps(record, ensure_ascii=False) + "\n").encode("utf8")
+
+
+def records_to_json_lines(records_xml) -> list:
+    """Converts serialized records (see `record_element_to_dict`) into UTF-8 encoded lines of JSON."""
+    return [to_json_line(record_element_to_dict(etree.fromstring(record_xml))) for record_xml in records_xml]
+
+
+def record_ranges_to_json_lines(filepath, root_start: bytes, root_end: bytes, ranges) -> list:
+    """Converts the records at the given byte offsets of an uncompressed raw file into lines of JSON, like `parse_record_ranges`."""
+    with open(filepath, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return [to_json_line(record_element_to_dict(etree.fromstring(root_start + mm[start:end] + root_end)[0]))
+                for start, end in ranges.tolist()]
+
+def release_element(elem):
+    """
+    Frees the memory of an element parsed with iterparse: clears it and removes the already parsed elements before it,
+    including those of its ancestors (e.g. the OAI-PMH headers and records around a MARC record).
+    """
+    elem.clear()
+    while elem is not None:
         while elem.getprevious() is not None:
             del elem.getparent()[0]
-        yield record_xml
+        elem = elem.getparent()
+
 
+def read_edm_records_stream(filepath):
+    """
+    Reads the OAI-PMH records with EDM metadata of a file one by one and yields them serialized,
+    releasing the memory of each record once it has been read. Records without metadata (e.g. deleted records) are skipped.
+    """
+    ns = get_namespaces()
+    with open_raw(filepath) as f:
+        context = etree.iterparse(f, events=("end",), tag="{http://www.openarchives.org/OAI/2.0/}record")
+        for event, elem in context:
+            record_xml = None
+            if elem.find("./oai:metadata/rdf:RDF/edm:ProvidedCHO", namespaces=ns) is not None:
+                record_xml = etree.tostring(elem, encoding="UTF-8")
+            release_element(elem)
+            if record_xml is not None:
+                yield record_xml
 
-def marc_to_dataframe(records_stream, num_records,columns_dict, rename_columns):
-    total_records = num_records
-    manager = multiprocessing.Manager()
-    queue = manager.Queue()
 
-    results = []
+def read_raw_records_stream(filepath):
+    """Reads the records with metadata of a (compressed) raw file as they are in the file (see `record_index.stream_records`)."""
+    with open_raw(filepath) as f:
+        yield from stream_records(f)
 
-    with ProcessPoolExecutor() as executor:
-        futures = [executor.submit(parse_record_with_queue, record, queue) for record in records_stream]
-        with tqdm(total=total_records) as pbar:
-            completed = 0
-            while completed < total_records:
-                queue.get()
-                pbar.update(1)
-                completed += 1
 
-            for future in as_completed(futures):
-                results.append(future.result())
+def read_marc_records_stream(filepath):
+    with open_raw(filepath) as f:
+        context = etree.iterparse(f, events=("end",), tag="{http://www.loc.gov/MARC21/slim}record")
+        for event, elem in context:
+            record_xml = etree.tostring(elem, encoding="UTF-8")
+            release_element(elem)
+            yield record_xml
+
+
+def chunked(iterable, chunk_size):
+    """Yields lists of up to `chunk_size` consecutive items of an iterable."""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def map_chunks_in_order(function, chunks, num_records=None, max_workers=None):
+    """
+    Applies a function that returns a list of results to chunks of work in parallel processes,
+    and yields the results in the order of the chunks.
+
+    At most two chunks per worker are submitted at a time, so only a bounded part of the work is held in memory,
+    and the results are collected chunk by chunk in the order of submission.
+    With a single worker, the chunks are processed one by one in the current process.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+
+    if max_workers == 1:
+        with tqdm(total=num_records) as pbar:
+            for chunk in chunks:
+                chunk_results = function(chunk)
+                pbar.update(len(chunk_results))
+                yield from chunk_results
+        return
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor, tqdm(total=num_records) as pbar:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(function, chunk))
+            if len(pending) >= 2 * max_workers:
+                chunk_results = pending.popleft().result()
+                pbar.update(len(chunk_results))
+                yield from chunk_results
+        while pending:
+            chunk_results = pending.popleft().result()
+            pbar.update(len(chunk_results))
+            yield from chunk_results
+
+
+def store_parsed_records(results, cache_path, parser_key):
+    """
+    Stores the newly parsed records of the (record, cache entry) pairs returned by `parse_records_cached`
+    in the record cache, and yields the records.
+    """
+    parsed = reused = 0
+    entries = []
+    with RecordCache(cache_path, parser_key) as cache:
+        for record, entry in results:
+            if entry is None:
+                reused += 1
+            else:
+                parsed += 1
+                entries.append(entry)
+                if len(entries) >= CHUNK_SIZE:
+                    cache.store(entries)
+                    entries = []
+            yield record
+        cache.store(entries)
+    print(f"Parsed {parsed} new or changed records, reused {reused} cached records.")
+
+
+def map_chunks_cached(function, chunks, cache_path, parser_key, num_records=None, max_workers=None):
+    """
+    Like `map_chunks_in_order`, for a function that parses a chunk of records with the record cache
+    (e.g. `parse_records_cached`): the newly parsed records are stored in the cache as they come in.
+    """
+    # create the cache before the workers open it
+    RecordCache(cache_path, parser_key).close()
+    function = partial(function, cache_path=str(cache_path), parser_key=parser_key)
+    results = map_chunks_in_order(function, chunks, num_records=num_records, max_workers=max_workers)
+    return store_parsed_records(results, cache_path, parser_key)
+
+
+def parse_marc_records(records_stream, num_records=None, chunk_size=CHUNK_SIZE, max_workers=None, columns=None, list_columns=None):
+    """
+    Parses a stream of MARC21XML records in parallel and yields the parsed records in the order of the stream.
+    The records are sent to the worker processes in chunks of `chunk_size`.
+    """
+    function = partial(parse_marcxml_records, columns=columns, list_columns=list_columns)
+    return map_chunks_in_order(function, chunked(records_stream, chunk_size),
+                               num_records=num_records, max_workers=max_workers)
+
+
+def parse_edm_records_stream(records_stream, num_records=None, chunk_size=CHUNK_SIZE, max_workers=None):
+    """
+    Parses a stream of serialized OAI-PMH records with EDM metadata in parallel and yields the parsed records in the order of the stream.
+    """
+    return map_chunks_in_order(parse_edm_records, chunked(records_stream, chunk_size),
+                               num_records=num_records, max_workers=max_workers)
+
+
+def parse_raw_records_stream_cached(filepath, cache_path, num_records=None, chunk_size=CHUNK_SIZE, max_workers=None,
+                                    columns=None, list_columns=None):
+    """
+    Parses the records of a compressed raw file in parallel, taking the unchanged records from the record cache,
+    and yields the parsed records in the order of the file. The records are streamed to the workers as they are
+    in the file (see `record_index.stream_records`) and cached under the same identifiers and hashes as in
+    `parse_indexed_records`, so that converting the compressed copy of a file reuses the records of the uncompressed one.
+    """
+    function = partial(parse_streamed_records_cached, columns=columns, list_columns=list_columns)
+    return map_chunks_cached(function, chunked(read_raw_records_stream(filepath), chunk_size), cache_path,
+                             get_parser_key(columns, list_columns), num_records=num_records, max_workers=max_workers)
+
+
+def parse_indexed_records(filepath, chunk_size=CHUNK_SIZE, max_workers=None, columns=None, list_columns=None, cache_path=None):
+    """
+    Parses the records of an uncompressed raw file in parallel and yields the parsed records in the order of the file.
+
+    Instead of streaming the records to the workers from the parent process, the workers get the byte offsets
+    of their records from the record index and read them from the memory-mapped file themselves.
+    With `cache_path`, unchanged records are taken from the record cache instead of being parsed again.
+    """
+    index = get_record_index(filepath)
+    ranges = index.ranges()
+    chunks = (ranges[i:i + chunk_size] for i in range(0, len(ranges), chunk_size))
+    if cache_path is not None:
+        function = partial(parse_record_ranges_cached, str(filepath), index.root_start, index.root_end,
+                           columns=columns, list_columns=list_columns)
+        return map_chunks_cached(function, chunks, cache_path, get_parser_key(columns, list_columns),
+                                 num_records=index.num_records, max_workers=max_workers)
+    function = partial(parse_record_ranges, str(filepath), index.root_start, index.root_end,
+                       columns=columns, list_columns=list_columns)
+    return map_chunks_in_order(function, chunks, num_records=index.num_records, max_workers=max_workers)
+
+
+def read_and_parse_records(filepath, format, num_records=None, columns=None, list_columns=None, cache_path=None):
+    """
+    Parses the MARC21XML or EDM records of a raw file in parallel, using the record index for uncompressed files
+    and streaming compressed files through the parent process. With `columns`, only these MARC paths are extracted,
+    and the MARC paths in `list_columns` are returned as lists. With `cache_path`, only new or changed records
+    are parsed and the others are taken from the record cache (see `record_cache.RecordCache`).
+    """
+    if can_index(filepath):
+        return parse_indexed_records(filepath, columns=columns, list_columns=list_columns, cache_path=cache_path)
+    if cache_path is not None:
+        return parse_raw_records_stream_cached(filepath, cache_path, num_records=num_records, columns=columns,
+                                               list_columns=list_columns)
+    if format == "edm":
+        return parse_edm_records_stream(read_edm_records_stream(filepath), num_records=num_records)
+    return parse_marc_records(read_marc_records_stream(filepath), num_records=num_records, columns=columns,
+                              list_columns=list_columns)
+
+
+def read_records_as_json(filepath, format, num_records=None, chunk_size=CHUNK_SIZE, max_workers=None):
+    """
+    Converts the records of a raw file into lines of JSON (see `record_element_to_dict`) in parallel
+    and yields them in the order of the file. Like `read_and_parse_records`, uncompressed files are read through
+    the record index by the workers and compressed files are streamed through the parent process.
+    """
+    if can_index(filepath):
+        index = get_record_index(filepath)
+        ranges = index.ranges()
+        chunks = (ranges[i:i + chunk_size] for i in range(0, len(ranges), chunk_size))
+        function = partial(record_ranges_to_json_lines, str(filepath), index.root_start, index.root_end)
+        return map_chunks_in_order(function, chunks, num_records=index.num_records, max_workers=max_workers)
+    records_stream = read_edm_records_stream(filepath) if format == "edm" else read_marc_records_stream(filepath)
+    return map_chunks_in_order(records_to_json_lines, chunked(records_stream, chunk_size),
+                               num_records=num_records, max_workers=max_workers)
+
+
+def marc_to_dataframe(records_stream, num_records, columns_dict, rename_columns, chunk_size=CHUNK_SIZE, max_workers=None):
+    """
+    Parses a stream of MARC21XML records in parallel and returns them as a DataFrame, with the rows in the order of the stream.
+    """
+    results = parse_marc_records(records_stream, num_records=num_records, chunk_size=chunk_size, max_workers=max_workers)
+    return records_to_dataframe(results, columns_dict, rename_columns)
+
+
+def records_to_dataframe(records, columns_dict, rename_columns):
+    results = list(records)
 
     print("Creating dataframe...")
     df = pd.DataFrame.from_records(results)
@@ -443,7 +1023,7 @@ def inspect_records(filepath):
     Parameters:
     -----------
     filepath : str
-        The path to the input XML file.
+        The path to the input XML file (optionally compressed with gzip or zstd, e.g. "enb.xml.gz").
 
     Returns:
     --------
@@ -454,13 +1034,26 @@ def inspect_records(filepath):
     -------
     ValueError
         If the file format cannot be determined.
+
+    Uncompressed files are inspected through their record index (see `record_index`), which is built on the first
+    call and cached next to the file, so inspecting the same file again is an O(1) lookup.
     """
+    if can_index(filepath):
+        index = get_record_index(filepath)
+        if index.format is None:
+            raise ValueError(
+                "Cannot determine data format. The OAI-PMH ListRecords response must be made up of either EDM or MARC21XML records."
+            )
+        print(f"Detected {index.format.upper()} format with {index.num_records} records.")
+        return index.format, index.num_records
+
     ns = get_namespaces()
     record_tags = [
         "{http://www.loc.gov/MARC21/slim}record",
         "{http://www.europeana.eu/schemas/edm/}ProvidedCHO",
     ]
-    context = etree.iterparse(filepath, events=("end",), tag=record_tags)
+    f = open_raw(filepath)
+    context = etree.iterparse(f, events=("end",), tag=record_tags)
 
     record_count = 0
     detected_format = None
@@ -477,10 +1070,9 @@ def inspect_records(filepath):
                 detected_format = "edm"
             record_count += 1
         # Clear the element to free memory
-        elem.clear()
-        while elem.getprevious() is not None:
-            del elem.getparent()[0]
+        release_element(elem)
     del context
+    f.close()
     if detected_format is None:
         raise ValueError(
             "Cannot determine data format. The OAI-PMH ListRecords response must be made up of either EDM or MARC21XML records."
@@ -489,17 +1081,27 @@ def inspect_records(filepath):
     return detected_format, record_count
 
 
-def oai_to_dataframe(filepath: str, rename_columns: bool=False) -> pd.DataFrame:
+def oai_to_dataframe(filepath: str, rename_columns: bool=False, columns: set=None, list_columns: set=None,
+                     cache_path: str=None) -> pd.DataFrame:
     """
     Converts an OAI-PMH file to a pandas DataFrame.
 
     Parameters:
     -----------
     filepath : str
-        The path to the input OAI-PMH file.
+        The path to the input OAI-PMH file (optionally compressed with gzip or zstd, e.g. "enb.xml.gz").
     rename_columns : bool, optional (default=True)
         In the case of MARC data, whether to replace the MARC field names with more informative ones
         (these unofficial field names are hand-crafted for about 200 different fields).
+    columns : set, optional (default=None)
+        In the case of MARC data, the MARC paths to extract (see `get_marc_projection`). By default, all
+        paths are extracted, which makes for a wide and sparse table with hundreds of rarely used columns.
+    list_columns : set, optional (default=None)
+        In the case of MARC data, the MARC paths whose repeated values are kept as lists (see `get_list_columns`)
+        instead of being joined into strings with "; ".
+    cache_path : str, optional (default=None)
+        The path of a record cache (see `record_cache.RecordCache`). If given, the records that are unchanged
+        since they were cached (e.g. by the conversion of a previous harvest) are not parsed again.
 
     Returns:
     --------
@@ -522,23 +1124,179 @@ def oai_to_dataframe(filepath: str, rename_columns: bool=False) -> pd.DataFrame:
     format, num_records = inspect_records(filepath)
     print("Proceeding to convert...")
     if format == "edm":
-        with open(filepath, "r", encoding="utf8") as f:
-            tree = etree.parse(f)
-            xml_records = read_edm_records(tree)
-            dc_records = (DCrecordParser(record).parse() for record in xml_records)
-            df = pd.DataFrame.from_records(dc_records).convert_dtypes()
+        records = read_and_parse_records(filepath, format, num_records=num_records, cache_path=cache_path)
+        df = pd.DataFrame.from_records(list(records)).convert_dtypes()
         return df
     elif format == "marc":
-        records_stream = read_marc_records_stream(filepath)
-        df = marc_to_dataframe(records_stream=records_stream,
-                               num_records=num_records,
-                               columns_dict=marc_columns_dict,
-                               rename_columns=rename_columns).convert_dtypes()
+        records = read_and_parse_records(filepath, format, num_records=num_records, columns=columns,
+                                         list_columns=list_columns, cache_path=cache_path)
+        df = records_to_dataframe(records=records,
+                                  columns_dict=marc_columns_dict,
+                                  rename_columns=rename_columns).convert_dtypes()
         return df
     else:
         raise ValueError("Unsupported format")
     
 
+def oai_to_parquet(filepath: str, output_path: str, rename_columns: bool=False, batch_size: int=10000, columns: set=None,
+                   list_columns: set=None, cache_path: str=None) -> int:
+    """
+    Converts an OAI-PMH file to a parquet file without holding the whole table in memory.
+
+    Unlike `oai_to_dataframe`, the parsed records are written to `output_path` in row groups of `batch_size` records
+    as they come in (see `ParquetRecordSink`), so the peak memory use depends on the batch size rather than the size
+    of the collection. New columns (e.g. MARC paths that only appear in later records) are added to the schema
+    as they appear, and are null in the earlier rows. With `columns`, only these MARC paths are extracted,
+    and the MARC paths in `list_columns` are written as list<string> columns. With `cache_path`, the records
+    that are unchanged since they were cached are taken from the record cache instead of being parsed again.
+
+    Returns the number of records written.
+    """
+    format, num_records = inspect_records(filepath)
+    print("Proceeding to convert...")
+    if format not in ("edm", "marc"):
+        raise ValueError("Unsupported format")
+    records = read_and_parse_records(filepath, format, num_records=num_records, columns=columns, list_columns=list_columns,
+                                     cache_path=cache_path)
+    if format == "marc" and rename_columns:
+        records = ({marc_columns_dict.get(path, path): value for path, value in record.items()} for record in records)
+
+    with ParquetRecordSink(output_path, batch_size=batch_size) as sink:
+        for record in records:
+            sink.write(record)
+    return sink.num_rows
+
+
+def oai_shards_to_dataframe(manifest_path: str, rename_columns: bool=False, id_column: str="001", columns: set=None,
+                            list_columns: set=None, cache_path: str=None) -> pd.DataFrame:
+    """
+    Converts the shard files of a sharded harvest (see `harvest.harvest_sharded`) to a single pandas DataFrame.
+
+    Records that changed during the harvest can appear in more than one shard; only the last occurrence is kept.
+    Records marked as deleted in a shard are removed from the earlier shards, as in `merge_oai_delta`.
+    """
+    manifest_path = Path(manifest_path)
+    with open(manifest_path, "r", encoding="utf8") as f:
+        manifest = json.load(f)
+
+    incomplete = [shard["path"] for shard in manifest["shards"] if not shard["complete"]]
+    if incomplete:
+        raise ValueError(f"The sharded harvest is not complete, missing shards: {incomplete}")
+
+    shards = []
+    for shard in manifest["shards"]:
+        if shard["records"] > 0:
+            shard_path = str(manifest_path.parent / shard["path"])
+            active_count, deleted_ids = read_record_statuses(shard_path)
+            print(f"Converting shard {shard['path']} ({shard['from']} - {shard['until']}): "
+                  f"{active_count} records, {len(deleted_ids)} deleted")
+            delta = None
+            if active_count > 0:
+                delta = oai_to_dataframe(shard_path, rename_columns=False, columns=columns, list_columns=list_columns,
+                                         cache_path=cache_path)
+            shards.append((delta, deleted_ids))
+
+    # The shards are applied like consecutive deltas: going from the last shard to the first, the records whose id
+    # was already changed or deleted in a later shard are dropped
+    dfs = []
+    later_ids = set()
+    for delta, deleted_ids in reversed(shards):
+        if delta is not None:
+            duplicated = delta[id_column].notna() & delta.duplicated(subset=id_column, keep="last")
+            delta = delta[~duplicated & ~delta[id_column].isin(later_ids)]
+            later_ids.update(delta[id_column].dropna())
+            dfs.append(delta)
+        later_ids.update(deleted_ids)
+
+    if not dfs:
+        df = pd.DataFrame(columns=[id_column])
+    else:
+        df = pd.concat(dfs[::-1]).reset_index(drop=True)
+
+    if rename_columns:
+        df.columns = [marc_columns_dict[col] if col in marc_columns_dict else col for col in df.columns]
+    return df
+
+
+def oai_identifier_to_record_id(identifier: str) -> str:
+    """
+    Converts an OAI-PMH record identifier to the record's control number (field 001).
+    The identifiers of the National Library of Estonia end with the control number, e.g. "oai:...:b1234567".
+    """
+    return identifier.rsplit(":", 1)[-1]
+
+
+def read_record_statuses(filepath):
+    """
+    Reads the OAI-PMH headers of an XML file and returns the number of active records
+    and the control numbers of records marked as deleted.
+    """
+    ns = get_namespaces()
+    f = open_raw(filepath)
+    context = etree.iterparse(f, events=("end",), tag="{http://www.openarchives.org/OAI/2.0/}header")
+
+    active_count = 0
+    deleted_ids = []
+    for event, elem in context:
+        if elem.get("status") == "deleted":
+            identifier = elem.findtext("./oai:identifier", namespaces=ns)
+            if identifier is not None:
+                deleted_ids.append(oai_identifier_to_record_id(identifier.strip()))
+        else:
+            active_count += 1
+        release_element(elem)
+    del context
+    f.close()
+
+    return active_count, deleted_ids
+
+
+def merge_oai_delta(filepath: str, converted_path: str, id_column: str = "001", columns: set = None,
+                    list_columns: set = None, cache_path: str = None) -> pd.DataFrame:
+    """
+    Merges an incrementally harvested OAI-PMH file into an existing converted parquet file.
+
+    Records present in the delta replace the records with the same id, records marked as deleted
+    are removed, and new records are appended.
+
+    Parameters:
+    -----------
+    filepath : str
+        The path to the harvested OAI-PMH file containing only the changed records.
+    converted_path : str
+        The path to the converted parquet file of the previous harvest.
+    id_column : str, optional (default="001")
+        The column holding the record id.
+    columns : set, optional (default=None)
+        The MARC paths to extract from the changed records (see `get_marc_projection`).
+    list_columns : set, optional (default=None)
+        The MARC paths converted to list columns (see `get_list_columns`), as in the existing parquet file.
+    cache_path : str, optional (default=None)
+        The path of the record cache (see `record_cache.RecordCache`), which the changed records are added to.
+
+    Returns:
+    --------
+    pandas.DataFrame
+        The merged DataFrame.
+    """
+    active_count, deleted_ids = read_record_statuses(filepath)
+    print(f"Found {active_count} new or changed records and {len(deleted_ids)} deleted records.")
+
+    df = pd.read_parquet(converted_path)
+    if active_count > 0:
+        delta = oai_to_dataframe(filepath, rename_columns=False, columns=columns, list_columns=list_columns,
+                                 cache_path=cache_path)
+        drop_ids = set(delta[id_column].dropna()) | set(deleted_ids)
+    else:
+        delta = None
+        drop_ids = set(deleted_ids)
+
+    df = df[~df[id_column].isin(drop_ids)]
+    if delta is not None:
+        df = pd.concat([df, delta])
+    return df.reset_index(drop=True)
+
+
 def oai_to_dict(filepath: str):
     """
     Parses an OAI-PMH XML file at `filepath` and returns a dictionary
@@ -556,18 +1314,14 @@ def oai_to_dict(filepath: str):
     Raises:
         TypeError: If the format of the XML file at `filepath` is not EDM or MARC21XML.
     """
-    f = open(filepath, "r", encoding="utf8")
-    tree = etree.parse(f)
-    format, num_records = inspect_records(tree)
+    format, num_records = inspect_records(filepath)
     if format == "edm":
-        xml_records = read_edm_records(tree)
-        f.close()
+        xml_records = read_edm_records(filepath)
         json_records = {"records": {}}
         for i, record in enumerate(xml_records):
             json_records["records"][str(i)] = DCrecordParser(record).parse()
         return json_records
     elif format == "marc":
-        f.close()
         marc_records = read_marc_records(filepath)
         json_records = {"records": {}}
         for i, record in enumerate(marc_records):
@@ -596,11 +1350,37 @@ def oai_to_json(filepath: str, json_output_path: str):
         json.dump(json_records, f)
 
 
+def oai_to_jsonl(filepath: str, jsonl_output_path: str, max_workers: int = None) -> int:
+    """
+    Converts an OAI-PMH XML file containing EDM Dublin Core or MARC21XML records to a JSON Lines file,
+    with one record per line in the same form as the records of `oai_to_dict`.
+
+    Unlike `oai_to_json`, the records are written as they are converted, without holding the collection in memory.
+    The records are converted in parallel by `max_workers` processes (all CPUs by default, 1 to convert them in the
+    current process) and written in the order of the file. Records without metadata (e.g. deleted records) are skipped.
+    The output is compressed if `jsonl_output_path` ends with .gz or .zst.
+
+    Args:
+        filepath (str): The path to the input OAI-PMH XML file (optionally compressed with gzip or zstd).
+        jsonl_output_path (str): The path where the output JSON Lines file will be saved.
+        max_workers (int): The number of worker processes.
+
+    Returns:
+        int: The number of records written.
+    """
+    format, num_records = inspect_records(filepath)
+    records_written = 0
+    with RawFileWriter(jsonl_output_path) as writer:
+        for line in read_records_as_json(filepath, format, num_records=num_records, max_workers=max_workers):
+            writer.write(line)
+            records_written += 1
+    return records_written
+
+
 if __name__ == "__main__":
 
     import sys
     key = sys.argv[1]
 
-    print(f"Converting {key} to dataframe")
-    df = oai_to_dataframe(f"{read_data_path}/{key}.xml", rename_columns=False)
-    df.to_parquet(f"{write_data_path}/{key}.parquet")
+    print(f"Converting {key} to parquet")
+    oai_to_parquet(f"{read_data_path}/{key}.xml", f"{write_data_path}/{key}.parquet", rename_columns=False)
@@ -1,7 +1,10 @@
 import sys
+import os
 from pathlib import Path
 import json
 import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 import numpy as np
 import pandas as pd
 import csv
@@ -9,15 +12,20 @@ import isbnlib
 from urllib.parse import urlparse
 from datetime import datetime
 from tqdm import tqdm
-import requests
 from requests.exceptions import RequestException
 
 if __name__ == "__main__":
     # when using this script from command line
     import constants
+    import http_session
+    from schema import write_curated_parquet
+    from curation_steps import CurationStep, merge_reports, print_report, run_steps
 else:
     # when using the clean_dataframe function as imported
     from src import constants
+    from src import http_session
+    from src.schema import write_curated_parquet
+    from src.curation_steps import CurationStep, merge_reports, print_report, run_steps
 
 current_script_path = Path(__file__)
 project_root = current_script_path.parent.parent
@@ -38,12 +46,86 @@ publisher_similarity_groups_file_path = project_root / "config" / "publishers" /
 
 MIN_YEAR = 1500
 MAX_YEAR = datetime.now().year
+# Minimum number of records per partition of a parallel curation. Each worker process pays a fixed cost of a second
+# or two (starting, loading the authority files, pickling its partition) while the steps clean about 10000 records
+# per second, so smaller partitions take longer in parallel than in a single process.
+MIN_PARTITION_RECORDS = 50000
 
 def load_converted_data(key: str):
     """Imports the converted data into a DataFrame."""
     df = pd.read_parquet(f"{read_data_path}/{key}.parquet")
     return df
 
+def split_values(entry, sep="; "):
+    """Returns the values of a repeated MARC field as a list, or None if the entry is missing.
+
+    Repeated fields are either strings joined with "; " or, when converted with list columns
+    (see `convert.get_list_columns`), lists (arrays when read from parquet).
+    """
+    if isinstance(entry, str):
+        return entry.split(sep)
+    if isinstance(entry, (list, tuple, np.ndarray)):
+        return list(entry)
+    return None
+
+def join_values(entry, sep="; "):
+    """Joins the values of a repeated MARC field given as a list into a single string, like the default conversion."""
+    if isinstance(entry, (list, tuple, np.ndarray)):
+        return sep.join(entry)
+    return entry
+
+def apply_unique(column, function, args=(), **kwargs):
+    """Applies a cleaning function to a column like `Series.apply`, but calls it only once per distinct value.
+
+    The column is factorized, the function is applied to the first row of each distinct value (including the missing values)
+    and the results are broadcast back to all rows. Cleaners returning tuples (multiple outputs) work the same way.
+    Unhashable values, like the lists of list columns, are factorized by their contents.
+    """
+    try:
+        codes, _ = pd.factorize(column)
+    except TypeError:
+        codes, _ = pd.factorize(column.map(lambda x: tuple(x) if isinstance(x, (list, np.ndarray)) else x))
+    unique_codes, first_positions = np.unique(codes, return_index=True)
+    results = column.iloc[first_positions].apply(function, args=args, **kwargs)
+    results = results.iloc[np.searchsorted(unique_codes, codes)]
+    results.index = column.index
+    return results
+
+def get_strings(column):
+    """Returns the string values of a column by their position, as the scalar cleaners only process strings."""
+    column = column.reset_index(drop=True)
+    if isinstance(column.dtype, pd.StringDtype):
+        return column.dropna()
+    return column[[type(value) == str for value in column]]
+
+def to_column(values, column, fill_value=None):
+    """Places values computed for some positions of a column (see `get_strings`) into a series aligned with the column."""
+    values = values.reindex(pd.RangeIndex(len(column)))
+    if fill_value is not pd.NA:
+        values = values.astype(object).where(values.notna(), fill_value)
+    return values.set_axis(column.index)
+
+def extract_named_groups(strings, pattern):
+    """Searches a pattern in a column of strings like `re.search` and returns its named groups as columns.
+
+    Groups that did not take part in the match, and all groups of strings without a match, are NaN.
+    Each distinct string is searched only once.
+    """
+    codes, uniques = pd.factorize(strings)
+    groups = pd.Series(uniques, dtype=object).str.extract(pattern, expand=True)
+    groups = groups[list(re.compile(pattern).groupindex)].iloc[codes]
+    groups.index = strings.index
+    return groups
+
+def to_integers(digits):
+    """Converts a column of digit strings (or NaN) to nullable integers. Non-ASCII digits are converted like `int` does."""
+    return digits.astype("float64").astype("Int64")
+
+def get_first_group(groups, names):
+    """Returns the name of the first of the given groups that took part in the match of each row, or NaN if none did."""
+    matched = groups[names].notna()
+    return matched.idxmax(axis=1).where(matched.any(axis=1))
+
 def roman_to_arabic(roman):
     """Converts a Roman numeral to an Arabic numeral."""
     roman_numerals = {
@@ -94,21 +176,46 @@ def extract_control_field_008_data(entry):
             return date_entered, publication_date, publication_place, publication_language, is_fiction
     return None, None, None, None, None
 
+# Literary form codes (008/33) of fiction and non-fiction
+FICTION_FORMS = ["1", "d", "f", "h", "j", "p"]
+NON_FICTION_FORMS = ["0", "e", "i", "s"]
+
+def decode_control_field_008(column):
+    """Extracts the data of extract_control_field_008_data() from a whole column of 008 fields at once,
+    by slicing the fixed positions of the strings.
+
+    MARC field(s): 008
+    """
+    column = column.astype("string[pyarrow]")
+    valid = column.str.len().between(38, 40).fillna(False).astype(bool)
+    column = column.where(valid)
+
+    # check if fiction (True, False or None as in extract_control_field_008_data())
+    literary_form = column.str.slice(33, 34)
+    is_fiction = pd.Series([None] * len(column), index=column.index, dtype=object)
+    is_fiction[literary_form.isin(FICTION_FORMS).to_numpy(dtype=bool, na_value=False)] = True
+    is_fiction[literary_form.isin(NON_FICTION_FORMS).to_numpy(dtype=bool, na_value=False)] = False
+
+    decoded = pd.DataFrame({
+        "date_entered": column.str.slice(0, 6),
+        "publication_date_control": column.str.slice(7, 11),
+        "publication_place_control": column.str.slice(15, 18),
+        "language": column.str.slice(35, 38),
+        "is_fiction": is_fiction,
+    })
+    return decoded
+
 def clean_entry_dates(dates):
-    """Cleans the entry dates from the 008 control field. Use after extract_control_field_008_data()."""
-    def parse_entry_dates(date):
-        """Convert a date in the format YYMMDD to YYYY-MM-DD."""
-        if isinstance(date, str):
-            if re.match("\d{6}", date):
-                year = int(date[:2])
-                if year >= 70:  # Assuming no overlap and 1970 is the threshold
-                    return '19' + date[:2] + "-" + date[2:4] + "-" + date[4:6]
-                else:
-                    return '20' + date[:2] + "-" + date[2:4] + "-" + date[4:6]
-        return None
+    """Cleans the entry dates from the 008 control field. Use after extract_control_field_008_data() or decode_control_field_008().
 
-    dates = dates.apply(parse_entry_dates)
-    dates = pd.to_datetime(dates, errors='coerce')
+    The dates in the format YYMMDD are parsed as a whole column, years from 70 on being in the 1900s and the others in the 2000s.
+    """
+    dates = dates.astype("string[pyarrow]")
+    dates = dates.where(dates.str.match(r"[0-9]{6}").fillna(False).astype(bool))
+    year = dates.str.slice(0, 2).astype("Int64")
+    # Assuming no overlap and 1970 is the threshold
+    year = year.where(year >= 70, year + 100) + 1900
+    dates = pd.to_datetime(year.astype("string[pyarrow]") + dates.str.slice(2, 6), format="%Y%m%d", errors='coerce')
 
     # Anything greater than the current date must be an insertion error
     today = pd.Timestamp.today().normalize()
@@ -122,8 +229,8 @@ def validate_isbn(entry):
     MARC field(s): 020$a
     """
     try:
-        if type(entry) == str:
-            entry_split = np.array(entry.split("; "))
+        entry_split = split_values(entry)
+        if entry_split is not None:
             valid_isbns = []
             for code in entry_split:
                 code = isbnlib.clean(code)
@@ -173,33 +280,50 @@ def clean_title_part_number(entry: str, pattern=constants.PATTERN_245n):
 
             return n+p
 
+def clean_title_part_numbers(column, pattern=constants.PATTERN_245n):
+    """Harmonizes the part number subfields of the titles like `clean_title_part_number`, but column-wise.
+
+    The rare part numbers in Roman numerals are still converted by `clean_title_part_number`.
+
+    MARC field(s): 245$n
+    """
+    strings = get_strings(column)
+    groups = extract_named_groups(strings, pattern)
+    roman = groups["rooma"].notna()
+    number_words = get_first_group(groups, [name for name in groups.columns if re.fullmatch(r"a\d{1,2}", name)])
+    n = groups["araabia"].fillna(number_words.str.lstrip("a")).fillna(groups["AB"].map({"A": "1", "B": "2"}))
+    p = (" [" + groups["p"].str.lstrip("[").str.strip("]") + "]").where(groups["p"].fillna("") != "", "")
+    cleaned = (n + p).where(groups["n"].notna()).astype(object)
+
+    cleaned[roman] = apply_unique(strings[roman], clean_title_part_number, pattern=pattern)
+    return to_column(cleaned, column)
+
 def extract_original_titles(df):
     """Extracts the original title from the fields 246 (combined from 260$a and 260$g during conversion), 240$a, and 130$a."""
     def handle_246(x):
         """Extracts the original title from the 246 field (always followed by the language in square brackets)."""
-        if isinstance(x, str):
-            processed_values = [val.rsplit(" [", maxsplit=1)[0] for val in x.split("; ") if re.search(r"\[.+\]$", val)]
+        values = split_values(x)
+        if values is not None:
+            processed_values = [val.rsplit(" [", maxsplit=1)[0] for val in values if re.search(r"\[.+\]$", val)]
             result = "; ".join(processed_values)
             return result if result else pd.NA
         else:
             return pd.NA
 
-    # Add values from 246 to a new column
-    df["title_original"] = pd.NA
-    df["title_original"] = df["246"].apply(handle_246)
+    # Take the values from 246
+    title_original = apply_unique(df["246"], handle_246)
 
     # Where 246 did not provide an original title, use 240 and then 130
-    df["title_original"] = df["title_original"].fillna(df["240$a"]).fillna(df["130$a"])
-
-    return df["title_original"]
+    return title_original.fillna(df["240$a"]).fillna(df["130$a"])
 
 def clean_varform_titles(entry):
     """Removes original titles from the 246 field and keeps other variant titles.
 
     MARC field(s): 246
     """
-    if isinstance(entry, str):
-        return "; ".join([val for val in entry.split("; ") if not re.search(r"\[.+\]$", val)])
+    values = split_values(entry)
+    if values is not None:
+        return "; ".join([val for val in values if not re.search(r"\[.+\]$", val)])
     else:
         return pd.NA
 
@@ -235,15 +359,31 @@ def extract_edition_number(entry, pattern=constants.PATTERN_250a):
             return "+"
         return None
 
+def extract_edition_numbers(column, pattern=constants.PATTERN_250a):
+    """Extracts the number of reprints from the edition statements like `extract_edition_number`, but column-wise.
+
+    MARC field(s): 250$a
+    """
+    strings = get_strings(column)
+    groups = extract_named_groups(strings, pattern)
+    number_words = get_first_group(groups, [name for name in groups.columns if re.fullmatch(r"a\d{1,2}", name)])
+    n = groups["araabia"].str.replace(r"\D", "", regex=True).fillna(number_words.str.lstrip("a"))
+    tr = groups["tr"].where(groups["tr"] != "")
+    n = n.where(n.notna() | tr.isna(), "+")
+    edition = (n.fillna("") + " [" + tr.fillna("") + "]").where(n.notna() | tr.notna(), "+")
+
+    return to_column(edition, column)
+
 def combine_publishing_fields(df):
     """Combines columns 260$a, 260$b, 260$c with columns 264$a, 264$b, 264$c.
 
     Explanation: In 2022, publishing data started to be entered into field 264, so these need to be combined with earlier data.
 
     MARC field(s): 260$a, 260$b, 260$c, 264$a, 264$b, 264$c
+
+    Returns the combined columns 260$a, 260$b, 260$c.
     """
-    for sub in ["a", "b", "c"]:
-        df[f"260${sub}"] = df[f"260${sub}"].fillna(df[f"264${sub}"])
+    return {f"260${sub}": df[f"260${sub}"].fillna(df[f"264${sub}"]) for sub in ["a", "b", "c"]}
 
 def extract_publication_year(entry, pattern=constants.PATTERN_260c, min_year=MIN_YEAR, max_year=MAX_YEAR):
     """Extracts the publication year and decade in numerical form from the field 260$c.
@@ -254,7 +394,7 @@ def extract_publication_year(entry, pattern=constants.PATTERN_260c, min_year=MIN
     output_decade = None
 
     if type(entry) != str:
-        if isinstance(entry, list):
+        if isinstance(entry, (list, tuple, np.ndarray)):
             entry = "; ".join(entry)
         else:
             try:
@@ -305,6 +445,48 @@ def extract_publication_year(entry, pattern=constants.PATTERN_260c, min_year=MIN
 
     return (output_year, output_decade)
 
+def extract_publication_years(column, pattern=constants.PATTERN_260c, min_year=MIN_YEAR, max_year=MAX_YEAR):
+    """Extracts the publication years and decades like `extract_publication_year`, but column-wise.
+
+    Returns the years and the decades as two nullable integer columns.
+
+    MARC field(s): 260$c
+    """
+    entries = column.map(join_values).reset_index(drop=True)
+    strings = get_strings(entries)
+    multiple = strings.str.contains(";", regex=False)
+
+    # Single year or decade
+    groups = extract_named_groups(strings[~multiple], pattern)
+    years = [to_integers(groups["year"])]
+    decades = [to_integers(groups["decade"].where(groups["year"].isna()).str.strip("?").str.replace("-", "0"))]
+
+    # Multiple years separated by ";": the earliest year, leaving out copyright years unless one is the first year given
+    parts = strings[multiple].str.split("; ").explode()
+    groups = extract_named_groups(parts, pattern)
+    has_year = groups["year"].notna()
+    is_first_year = has_year & (has_year.groupby(level=0).cumsum() == 1)
+    included = has_year & (groups["copyright"].isna() | is_first_year)
+    years.append(to_integers(groups["year"][included]).groupby(level=0).min())
+
+    # Other values are converted to strings by `extract_publication_year`
+    others = entries[entries.notna() & ~entries.index.isin(strings.index)]
+    if len(others):
+        other_years = pd.DataFrame(apply_unique(others, extract_publication_year, min_year=min_year, max_year=max_year).to_list(),
+                                   index=others.index, dtype="Int64")
+        years.append(other_years[0])
+        decades.append(other_years[1])
+
+    year = to_column(pd.concat(years), column, fill_value=pd.NA)
+    decade = to_column(pd.concat(decades), column, fill_value=pd.NA)
+
+    # Years outside the range are left out, the decades of the other years are derived from them
+    nonzero_year = year.fillna(0) != 0
+    in_range = year.between(min_year, max_year).fillna(False)
+    decade = decade.mask(nonzero_year & in_range, year // 10 * 10)
+    year = year.mask(nonzero_year & ~in_range)
+    return year, decade
+
 def extract_page_count(entry: str, pattern=constants.PATTERN_300a):
     """Extracts page numbers from the physical description field.
 
@@ -332,6 +514,25 @@ def extract_page_count(entry: str, pattern=constants.PATTERN_300a):
 
             return lk
 
+def extract_page_counts(column, pattern=constants.PATTERN_300a):
+    """Extracts the page counts from the physical descriptions like `extract_page_count`, but column-wise.
+
+    MARC field(s): 300$a
+    """
+    strings = get_strings(column)
+    groups = extract_named_groups(strings, pattern)
+    page_range = groups["vahemik"].str.split("-", n=1)
+    range_count = to_integers(page_range.str[1]) - to_integers(page_range.str[0].str.replace(r"\D", "", regex=True))
+    number = to_integers(groups["arv"])
+    brackets = to_integers(groups["sulud"].str.lstrip("[").str.strip("]"))
+
+    is_pages = groups["uhik"].isin(["l", "lk", "lehte", "lehekülg", "lehekülge", "nummerdamata lehekülge"])
+    no_unit = groups["uhik"].fillna("") == ""
+    page_count = range_count.where(is_pages | no_unit)
+    page_count = page_count.fillna(number.where(is_pages)).fillna(brackets.where(is_pages & number.isna()))
+
+    return to_column(page_count, column, fill_value=pd.NA)
+
 def has_illustrations(entry):
     """Checks whether the work has an illustration note.
 
@@ -458,8 +659,8 @@ def clean_electronic_access_urls(entry):
 
     MARC field(s): 856$u
     """
-    if type(entry) == str:
-        entry_split = entry.split("; ")
+    entry_split = split_values(entry)
+    if entry_split is not None:
         return "; ".join([url.strip().lstrip() for url in entry_split if is_valid_url(url.strip().lstrip())])
 
 def resolve_multiple_person_ids(entry):
@@ -560,17 +761,14 @@ def check_if_posthumous(creators, publication_date, contributors=None):
     if not isinstance(publication_date, int):
         return None
 
-    if isinstance(creators, str):
-        creators_list = creators.split("; ")
-    else:
-        creators_list = []
+    creators_list = split_values(creators) or []
 
     # Option to add contributors whose role is defined as "autor"
-    if isinstance(contributors, str):
-        if "[autor]" in contributors:
-            for c in contributors.split("; "):
-                if extract_person_info(c, role=True)[3] == "autor":
-                    creators_list.append(c)
+    contributors_list = split_values(contributors) or []
+    if any("[autor]" in c for c in contributors_list):
+        for c in contributors_list:
+            if extract_person_info(c, role=True)[3] == "autor":
+                creators_list.append(c)
 
     if len(creators_list) == 0:
         return None
@@ -596,39 +794,46 @@ def check_if_posthumous(creators, publication_date, contributors=None):
     # Otherwise, a missing death date is justified and means that one of the authors is/was alive 
     return False
 
-def harmonize_placenames(place_column):
-    """Uses an external authority file to map placenames to their harmonized versions, accounting for multiple names in a single cell."""
-    # Load mapping data from file
+@lru_cache(maxsize=None)
+def load_placename_mapping():
+    """Reads the mapping of placenames to their harmonized versions (once per process)."""
     with open(placenames_file_path, "r", encoding="utf8") as f:
         place_names = pd.read_csv(f, sep="\t", encoding="utf8")
 
     # Create a dictionary to map original to harmonized names
     place_names = place_names.query("place_harmonized.notna()")
-    mapping = dict(zip(place_names["place_original"], place_names["place_harmonized"]))
+    return dict(zip(place_names["place_original"], place_names["place_harmonized"]))
 
-    # Split, map, and rejoin using vectorized operations, handling NA values
-    harmonized_placenames = (
-        place_column
-        .apply(lambda x: "; ".join(mapping.get(place, place) for place in x.split("; ")) if pd.notna(x) else x)
-    )
+def harmonize_placenames(place_column):
+    """Uses an external authority file to map placenames to their harmonized versions, accounting for multiple names in a single cell."""
+    mapping = load_placename_mapping()
 
-    # Remove duplicate placenames within each cell
-    harmonized_placenames = (
-        harmonized_placenames
-        .apply(lambda x: "; ".join(dict.fromkeys(x.split("; "))) if pd.notna(x) else x)
-    )
+    def harmonize_cell(cell):
+        values = split_values(cell)
+        if values is None:
+            return cell
+        # Map each placename and remove duplicate placenames within the cell
+        return "; ".join(dict.fromkeys(mapping.get(place, place) for place in values))
+
+    # Split, map, and rejoin, handling NA values
+    harmonized_placenames = apply_unique(place_column, harmonize_cell)
     
     return harmonized_placenames
 
-def get_coordinates(place_column):
-    """Uses the external authority file to map placenames to their coordinates, handling multiple placenames in a single cell."""
-    # Load mapping data from file
+@lru_cache(maxsize=None)
+def load_coordinates_mapping():
+    """Reads the mappings of harmonized placenames to their latitude and longitude (once per process)."""
     with open(coordinates_file_path, "r", encoding="utf8") as f:
         coordinates = pd.read_csv(f, sep="\t", encoding="utf8")
-    
+
     # Create dictionaries to map placename to lat and lon
     mapping_lat = dict(zip(coordinates["place_harmonized"], coordinates["lat"]))
     mapping_lon = dict(zip(coordinates["place_harmonized"], coordinates["lon"]))
+    return mapping_lat, mapping_lon
+
+def get_coordinates(place_column):
+    """Uses the external authority file to map placenames to their coordinates, handling multiple placenames in a single cell."""
+    mapping_lat, mapping_lon = load_coordinates_mapping()
 
     # Define a function to retrieve the first available coordinates from multiple placenames
     def get_first_coordinates(places):
@@ -640,28 +845,32 @@ def get_coordinates(place_column):
         return None, None  # Return None if no valid coordinates are found
 
     # Apply the function, handling NA values
-    coordinates = place_column.apply(lambda x: get_first_coordinates(x) if pd.notna(x) else (None, None))
+    coordinates = apply_unique(place_column, lambda x: get_first_coordinates(x) if pd.notna(x) else (None, None))
     
     # Convert the resulting list of tuples into a DataFrame with columns 'lat' and 'lon'
     coordinates_df = pd.DataFrame(coordinates.tolist(), columns=["lat", "lon"])
     
     return coordinates_df
 
+@lru_cache(maxsize=None)
+def load_publisher_mapping():
+    """Reads the mapping of publisher names to their harmonized versions (once per process)."""
+    harmonized_publishers = pd.read_csv(publisher_harmonization_file_path, sep="\t", encoding="utf8")
+    return dict(zip(harmonized_publishers["publisher_original"], harmonized_publishers["publisher_harmonized"]))
+
 def harmonize_publishers(publishers_column):
     """
     Harmonize publisher names in a column using the mapping in config.
     """
-    # Load the harmonization mapping from the file
-    harmonized_publishers = pd.read_csv(publisher_harmonization_file_path, sep="\t", encoding="utf8")
-    mapping = dict(zip(harmonized_publishers["publisher_original"], harmonized_publishers["publisher_harmonized"]))
+    mapping = load_publisher_mapping()
 
     def harmonize_cell(cell):
-        # If it's NaN or not a string, return as-is (or return "" if you prefer).
-        if pd.isna(cell) or not isinstance(cell, str):
+        # If it's NaN or not a string or list, return as-is (or return "" if you prefer).
+        values = split_values(cell)
+        if values is None:
             return cell
 
         # Split, map, and join back
-        values = cell.split("; ")
         harmonized_values = [mapping.get(value, value) for value in values]
         # Keep only strings (removes values mapped to NaN)
         harmonized_values = [value for value in harmonized_values if isinstance(value, str)]
@@ -672,9 +881,11 @@ def harmonize_publishers(publishers_column):
         
 
     # Apply the harmonization function to the entire column
-    return publishers_column.apply(harmonize_cell)
+    return apply_unique(publishers_column, harmonize_cell)
 
-def group_publishers_by_similarity(df):
+@lru_cache(maxsize=None)
+def load_publisher_similarity_groups():
+    """Reads the similarity groups of the harmonized publishers of each publication place (once per process)."""
     groups_df = pd.read_csv(
         publisher_similarity_groups_file_path, 
         sep="\t", 
@@ -692,12 +903,14 @@ def group_publishers_by_similarity(df):
         publisher_to_group = dict(zip(group['publisher_harmonized'], group['publisher_similarity_group']))
         location_publisher_to_group[location] = publisher_to_group
 
-    publisher_similarity_groups = []
+    return location_publisher_to_group
 
-    for idx, row in df.iterrows():
-        location = row['publication_place_harmonized']
-        publishers = row['publisher_harmonized']
+def group_publishers_by_similarity(places_column, publishers_column):
+    """Returns the similarity groups of the harmonized publishers, given the harmonized publication places."""
+    location_publisher_to_group = load_publisher_similarity_groups()
+    publisher_similarity_groups = []
 
+    for location, publishers in zip(places_column, publishers_column):
         if pd.isnull(publishers):
             publisher_similarity_groups.append(None)
             continue
@@ -713,14 +926,12 @@ def group_publishers_by_similarity(df):
         similarity_group_str = '; '.join(publisher_group_list)
         publisher_similarity_groups.append(similarity_group_str)
 
-    df['publisher_similarity_group'] = publisher_similarity_groups
-
-    return df
+    return pd.Series(publisher_similarity_groups, index=publishers_column.index, dtype=object)
 
 def get_viaf_and_wkp_ids(id_number):
     try:
         url = f"https://www.viaf.org/viaf/sourceID/ERRR|{id_number}"
-        r = requests.get(url, headers={"Accept": "application/ld+json"})
+        r = http_session.get(url, headers={"Accept": "application/ld+json"})
         r.raise_for_status()
 
         graph = r.json().get("@graph", [])
@@ -746,7 +957,8 @@ def update_authority_and_df(input_df, strip_prefix=True):
     """
     # Step 1: Load external authority file and identify new ids
     try:
-        links = pd.read_csv(persons_links_file_path, sep="\t", encoding="utf8")
+        # the ids are read as strings, so that long VIAF ids are not rounded to floats
+        links = pd.read_csv(persons_links_file_path, sep="\t", encoding="utf8", dtype=str)
         existing_ids = set(links["rara_id"])
     except Exception as e:
         print(f"VIAF and Wikidata linking: Error loading authority file: {e}")
@@ -821,169 +1033,216 @@ def update_authority_and_df(input_df, strip_prefix=True):
     
     return input_df
 
-def apply_gender_mapping(id_column):
-    """Reads external gender data (combined from NLE, VIAF, Wikidata) and applies the mapping to the dataframe."""
+@lru_cache(maxsize=None)
+def load_gender_mapping():
+    """Reads the external gender data (combined from NLE, VIAF, Wikidata) once per process."""
     gender_data = pd.read_csv(persons_gender_file_path, sep="\t", encoding="utf8")
-    gender_mapping = dict(zip(gender_data["rara_id"], gender_data["gender"]))
-    return id_column.map(gender_mapping)
+    return dict(zip(gender_data["rara_id"], gender_data["gender"]))
 
-def apply_dates_mapping(id_column):
-    """Reads external dates data (from VIAF) and applies the mapping to the dataframe."""
+@lru_cache(maxsize=None)
+def load_dates_mapping():
+    """Reads the external dates data (from VIAF) once per process."""
     dates_data = pd.read_csv(persons_dates_file_path, sep="\t", encoding="utf8")
     birth_mapping = dict(zip(dates_data["rara_id"], dates_data["birth_date"]))
     death_mapping = dict(zip(dates_data["rara_id"], dates_data["death_date"]))
+    return birth_mapping, death_mapping
+
+def apply_gender_mapping(id_column):
+    """Reads external gender data (combined from NLE, VIAF, Wikidata) and applies the mapping to the dataframe."""
+    return id_column.map(load_gender_mapping())
+
+def apply_dates_mapping(id_column):
+    """Reads external dates data (from VIAF) and applies the mapping to the dataframe."""
+    birth_mapping, death_mapping = load_dates_mapping()
     return id_column.map(birth_mapping), id_column.map(death_mapping)
 
-def curate_books(df):
-
-    ### 008: control field
-    if "008" in df.columns:
-        print("Cleaning and harmonizing control field 008")
-        df[["date_entered","publication_date_control", "publication_place_control", "language", "is_fiction"]] = df["008"].apply(extract_control_field_008_data).to_list()
-        df = df.drop("008", axis=1)
-        # Entry date
-        df["date_entered"] = clean_entry_dates(df["date_entered"])
-
-    ### 020$a: ISBN
-    if "020$a" in df.columns:
-        print("Validating ISBN codes")
-        df["isbn"] = df["020$a"].apply(validate_isbn)
-        df = df.drop("020$a", axis=1)
-
-    ### 245$n: part number
-    if "245$n" in df.columns:
-        print("Cleaning and harmonizing part numeration")
-        df["title_part_nr_cleaned"] = df["245$n"].apply(clean_title_part_number)
-        # df = df.drop("245$n", axis=1)
-
-    ### 246, 130$a, 240$a: original title and variant titles
-    if all([col in df.columns for col in ["246", "130$a", "240$a"]]):
-        print("Extracting original titles")
-        df["title_original"] = extract_original_titles(df)
-        df["title_varform"] = df["246"].apply(clean_varform_titles)
-        df = df.drop(["246", "130$a", "240$a"], axis=1)  
-
-    ### 250$a: edition statement
-    if "250$a" in df.columns:
-        print("Cleaning edition statement")
-        df["edition_n"] = df["250$a"].apply(extract_edition_number)
-
-    ### 260, 264: publication info
-    if all([col in df.columns for col in ["260$a", "260$b", "260$c","264$a", "264$b", "264$c"]]):
-        combine_publishing_fields(df)
-        df = df.drop(["264$a", "264$b", "264$c"], axis=1)
-    if all([col in df.columns for col in ["260$a", "260$b", "260$c"]]):   
-        print("Cleaning publishing date")
-        df[["publication_date_cleaned", "publication_decade"]] = df["260$c"].apply(extract_publication_year).to_list()
-        # Convert to Int64 right away for check_if_posthumous to work later
-        df[["publication_date_cleaned", "publication_decade"]] = df[["publication_date_cleaned", "publication_decade"]].astype("Int64", errors="ignore")
-        
-    ### 300$a: page count
-    if "300$a" in df.columns:
-        print("Extracting page counts")
-        df["page_count"] = df["300$a"].apply(extract_page_count)
-        df = df.drop("300$a", axis=1)
-
-    ### 300$b: illustrations
-    if "300$b" in df.columns:
-        print("Filtering illustrations")
-        df["is_illustrated"] = df["300$b"].apply(has_illustrations)
-        df = df.drop("300$b", axis=1)
-
-    ### 300$c: physical dimensions
-    if "300$c" in df.columns:
-        print("Extracting physical dimensions")
-        df["physical_size"] = df["300$c"].apply(extract_physical_dimensions)
-        df = df.drop("300$c", axis=1)
-
-    ### 500$a: general notes (print run, price, typeface)
-    if "500$a" in df.columns:
-        print("Extracting print run, price, typeface")
-        df[["print_run", "price", "typeface"]] = df["500$a"].apply(extract_print_run_price_typeface).to_list()
-        df = df.drop("500$a", axis=1)
-
-    ### 504$a: bibliography & index
-    if "504$a" in df.columns:
-        print("Filtering bibliographies/registers")
-        df["has_bibliography_register"] = df["504$a"].apply(extract_bibliography_index_info)
-        df = df.drop("504$a", axis=1)
-
-    ### 533$a: digital reproduction
-    if "533$a" in df.columns: 
-        print("Filtering digital reproductions")
-        df["is_digitized"] = df["533$a"].apply(has_electronic_reproduction)
-        df = df.drop("533$a", axis=1)
-
-    ### 533$d: digitization year
-    if "533$d" in df.columns:
-        print("Extracting digitization year")
-        df["digitized_year"] = df["533$d"].apply(extract_digitization_year)
-        df = df.drop("533$d", axis=1)
-
-    ### 534$c: original publication info
-    if "534$c" in df.columns:
-        print("Extracting original distribution info")
-        df[["original_distribution_year", "original_distribution_place", "original_distribution_publisher"]] = df["534$c"].apply(extract_original_publication_info).to_list()
-        df["original_distribution_place"] = harmonize_placenames(df["original_distribution_place"])
-        df = df.drop("534$c", axis=1)
-
-    ### 856$u: electronic access
-    if "856$u" in df.columns:
-        print("Cleaning digital access URIs")
-        df["access_uri"] = df["856$u"].apply(clean_electronic_access_urls)
-        df = df.drop("856$u", axis=1)
-
-    ### Define posthumously published records
-    if all([col in df.columns for col in ["100", "publication_date_cleaned"]]):
-        print("Defining posthumously published records")
-        df["is_posthumous"] = df.apply(lambda x: check_if_posthumous(x["100"], x["publication_date_cleaned"]), axis=1)
-
-    ### Harmonize publication places
-    if "260$a" in df.columns:
-        print("Harmonizing and linking publication places")
-        df["publication_place_harmonized"] = harmonize_placenames(df["260$a"])
-        df[["publication_place_latitude", "publication_place_longitude"]] = get_coordinates(df["publication_place_harmonized"])
-
-    ### Harmonize manufacturing places
-    if "260$e" in df.columns:
-        print("Harmonizing manufacturing places")
-        df["manufacturing_place"] = harmonize_placenames(df["260$e"])
-        df = df.drop("260$e", axis=1)
-
-    ### Harmonize publishers
-    if "260$b" in df.columns:
-        print("Harmonizing publishers")
-        df["publisher_harmonized"] = harmonize_publishers(df["260$b"])
-        df = group_publishers_by_similarity(df)
+def curate_partition(curate, partition, kwargs):
+    """
+    Runs a curation function on a partition of the dataframe in a worker process and returns the curated partition
+    with its step report. The progress messages of the steps are left out, the messages of the cleaners are printed.
+    """
+    return curate(partition.reset_index(drop=True), verbose=False, **kwargs)
+
+def curate_in_partitions(df, curate, max_workers=None, cache_dir=None, min_partition_records=MIN_PARTITION_RECORDS, **kwargs):
+    """
+    Runs a curation function of row-local steps on partitions of the dataframe in parallel processes
+    and concatenates the results in the original order.
+
+    The dataframe is split into one partition of consecutive rows per worker (all CPUs by default), but into no more
+    partitions than it has `min_partition_records` records: partitioning only pays off for large collections
+    (see MIN_PARTITION_RECORDS), smaller ones are curated in this process. The authority files are read once per
+    worker process. The step reports of the partitions are summed up and printed at the end. The steps of each
+    partition are cached in their own subdirectory of `cache_dir` (see `run_steps`), so the cache is reused by runs
+    with the same number of partitions.
+    """
+    max_workers = min(max_workers or os.cpu_count() or 1, len(df) // max(min_partition_records, 1))
+    if max_workers <= 1:
+        df, report = curate(df, cache_dir=cache_dir, **kwargs)
+        return df
+
+    print(f"Curating {len(df)} records in {max_workers} partitions")
+    partitions = [df.iloc[positions] for positions in np.array_split(np.arange(len(df)), max_workers)]
+    partition_kwargs = [{**kwargs, "cache_dir": Path(cache_dir) / f"partition_{i}" if cache_dir is not None else None}
+                        for i in range(len(partitions))]
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = list(tqdm(executor.map(curate_partition, [curate] * len(partitions), partitions, partition_kwargs),
+                            total=len(partitions)))
+    print_report(merge_reports([report for partition, report in results]))
+    return pd.concat([partition for partition, report in results], ignore_index=True).set_axis(df.index)
+
+### Curation steps of the books
+
+def clean_control_field_008(df):
+    decoded = decode_control_field_008(df["008"])
+    decoded["date_entered"] = clean_entry_dates(decoded["date_entered"])
+    return decoded
+
+def clean_original_and_variant_titles(df):
+    return {"title_original": extract_original_titles(df), "title_varform": apply_unique(df["246"], clean_varform_titles)}
+
+def clean_publication_years(df):
+    # Int64 right away for check_if_posthumous to work later
+    year, decade = extract_publication_years(df["260$c"])
+    return {"publication_date_cleaned": year, "publication_decade": decade}
+
+def clean_general_notes(df):
+    return pd.DataFrame(apply_unique(df["500$a"], extract_print_run_price_typeface).to_list(),
+                        columns=["print_run", "price", "typeface"], index=df.index)
+
+def clean_original_distribution(df):
+    distribution = pd.DataFrame(apply_unique(df["534$c"], extract_original_publication_info).to_list(),
+                                columns=["original_distribution_year", "original_distribution_place", "original_distribution_publisher"],
+                                index=df.index)
+    distribution["original_distribution_place"] = harmonize_placenames(distribution["original_distribution_place"])
+    return distribution
+
+def define_posthumous(df):
+    return {"is_posthumous": df.apply(lambda x: check_if_posthumous(x["100"], x["publication_date_cleaned"]), axis=1)}
+
+def harmonize_publication_places(df):
+    places = harmonize_placenames(df["260$a"])
+    coordinates = get_coordinates(places)
+    return {"publication_place_harmonized": places,
+            "publication_place_latitude": coordinates["lat"], "publication_place_longitude": coordinates["lon"]}
+
+def harmonize_and_group_publishers(df):
+    publishers = harmonize_publishers(df["260$b"])
+    return {"publisher_harmonized": publishers,
+            "publisher_similarity_group": group_publishers_by_similarity(df["publication_place_harmonized"], publishers)}
+
+def cleaning_step(name, function, column, output, message):
+    """Returns the step of a cell cleaner applied to a single column (see `apply_unique`), which is dropped afterwards."""
+    return CurationStep(name, lambda df: {output: apply_unique(df[column], function)}, inputs=[column], outputs=[output],
+                        drops=[column], message=message)
+
+BOOK_STEPS = [
+    CurationStep("control_field_008", clean_control_field_008, inputs=["008"],
+                 outputs=["date_entered", "publication_date_control", "publication_place_control", "language", "is_fiction"],
+                 drops=["008"], message="Cleaning and harmonizing control field 008", version=2),
+    cleaning_step("isbn", validate_isbn, "020$a", "isbn", "Validating ISBN codes"),
+    CurationStep("part_number", lambda df: {"title_part_nr_cleaned": clean_title_part_numbers(df["245$n"])},
+                 inputs=["245$n"], outputs=["title_part_nr_cleaned"], message="Cleaning and harmonizing part numeration"),
+    CurationStep("titles", clean_original_and_variant_titles, inputs=["246", "130$a", "240$a"],
+                 outputs=["title_original", "title_varform"], drops=["246", "130$a", "240$a"], message="Extracting original titles"),
+    CurationStep("edition", lambda df: {"edition_n": extract_edition_numbers(df["250$a"])},
+                 inputs=["250$a"], outputs=["edition_n"], message="Cleaning edition statement"),
+    CurationStep("publishing_fields", combine_publishing_fields, inputs=["260$a", "260$b", "260$c", "264$a", "264$b", "264$c"],
+                 outputs=["260$a", "260$b", "260$c"], drops=["264$a", "264$b", "264$c"]),
+    CurationStep("publication_date", clean_publication_years, inputs=["260$a", "260$b", "260$c"],
+                 outputs=["publication_date_cleaned", "publication_decade"], message="Cleaning publishing date"),
+    CurationStep("page_count", lambda df: {"page_count": extract_page_counts(df["300$a"])},
+                 inputs=["300$a"], outputs=["page_count"], drops=["300$a"], message="Extracting page counts"),
+    cleaning_step("illustrations", has_illustrations, "300$b", "is_illustrated", "Filtering illustrations"),
+    cleaning_step("physical_size", extract_physical_dimensions, "300$c", "physical_size", "Extracting physical dimensions"),
+    CurationStep("general_notes", clean_general_notes, inputs=["500$a"], outputs=["print_run", "price", "typeface"],
+                 drops=["500$a"], message="Extracting print run, price, typeface"),
+    cleaning_step("bibliography", extract_bibliography_index_info, "504$a", "has_bibliography_register",
+                  "Filtering bibliographies/registers"),
+    cleaning_step("digitized", has_electronic_reproduction, "533$a", "is_digitized", "Filtering digital reproductions"),
+    cleaning_step("digitized_year", extract_digitization_year, "533$d", "digitized_year", "Extracting digitization year"),
+    CurationStep("original_distribution", clean_original_distribution, inputs=["534$c"],
+                 outputs=["original_distribution_year", "original_distribution_place", "original_distribution_publisher"],
+                 drops=["534$c"], message="Extracting original distribution info", files=[placenames_file_path]),
+    cleaning_step("access_uri", clean_electronic_access_urls, "856$u", "access_uri", "Cleaning digital access URIs"),
+    CurationStep("posthumous", define_posthumous, inputs=["100", "publication_date_cleaned"], outputs=["is_posthumous"],
+                 message="Defining posthumously published records"),
+    CurationStep("publication_place", harmonize_publication_places, inputs=["260$a"],
+                 outputs=["publication_place_harmonized", "publication_place_latitude", "publication_place_longitude"],
+                 message="Harmonizing and linking publication places", files=[placenames_file_path, coordinates_file_path]),
+    CurationStep("manufacturing_place", lambda df: {"manufacturing_place": harmonize_placenames(df["260$e"])},
+                 inputs=["260$e"], outputs=["manufacturing_place"], drops=["260$e"], message="Harmonizing manufacturing places",
+                 files=[placenames_file_path]),
+    CurationStep("publishers", harmonize_and_group_publishers, inputs=["260$b", "publication_place_harmonized"],
+                 outputs=["publisher_harmonized", "publisher_similarity_group"], message="Harmonizing publishers",
+                 files=[publisher_harmonization_file_path, publisher_similarity_groups_file_path]),
+]
+
+def curate_books(df, max_workers=1, steps=None, cache_dir=None):
+    """
+    Cleans and harmonizes the converted books dataframe with the steps in BOOK_STEPS (see `run_steps`).
+
+    With `steps`, only the steps with these names are run. With `cache_dir`, the outputs of the steps are cached there,
+    and the steps whose inputs have not changed since are not run again.
+    With `max_workers` other than 1, the cleaning runs on partitions of the dataframe in that many processes
+    (all CPUs with None, see `curate_in_partitions`). This is only faster for collections of more than
+    MIN_PARTITION_RECORDS records per partition, smaller collections are cleaned in a single process.
+    """
+    if max_workers == 1:
+        df, report = curate_books_partition(df, steps=steps, cache_dir=cache_dir)
+    else:
+        df = curate_in_partitions(df, curate_books_partition, max_workers=max_workers, steps=steps, cache_dir=cache_dir)
 
     ### Formatting
     df = df.convert_dtypes()
 
     return df
 
-def curate_persons(df):
+def curate_books_partition(df, steps=None, cache_dir=None, verbose=True):
+    """
+    Runs the cleaning steps of `curate_books`, which only depend on the values of each row, on (a partition of) the dataframe.
+    Returns the cleaned dataframe and the step report (see `run_steps`).
+    """
+    return run_steps(df, BOOK_STEPS, names=steps, cache_dir=cache_dir, verbose=verbose)
 
-    ### resolve incorrect ids
-    print("Resolving entries with multiple IDs")
-    df["id"] = df["001"].apply(resolve_multiple_person_ids)
-    df = df.drop("001", axis=1)
+### Curation steps of the persons
 
-    ### 100: retrieving name and dates from 100 subfields
-    print("Extracting names and dates")
-    df[["name", "birth_date", "death_date"]] = df["100"].apply(extract_person_info, args=(False,)).to_list()
-    df["birth_date"] = df["birth_date"].astype("Int64", errors="ignore")
-    df["death_date"] = df["death_date"].astype("Int64", errors="ignore")
+def extract_names_and_dates(df):
+    persons = pd.DataFrame(apply_unique(apply_unique(df["100"], join_values), extract_person_info, args=(False,)).to_list(),
+                           columns=["name", "birth_date", "death_date"], index=df.index)
+    persons["birth_date"] = persons["birth_date"].astype("Int64", errors="ignore")
+    persons["death_date"] = persons["death_date"].astype("Int64", errors="ignore")
+    return persons
 
-    ### Update birth and death dates from external sources where missing
-    print("Updating birth and death dates from external sources")
+def update_dates_from_external_sources(df):
     external_birth, external_death = apply_dates_mapping(df["id"])
-    df["birth_date"] = df["birth_date"].fillna(external_birth)
-    df["death_date"] = df["death_date"].fillna(external_death)
-
-    ### 375$a: cleaning and harmonizing gender identities
-    print("Cleaning and harmonizing gender identities")
-    df["gender"] = apply_gender_mapping(df["id"])
-    df = df.drop("375$a", axis=1)
+    return {"birth_date": df["birth_date"].fillna(external_birth), "death_date": df["death_date"].fillna(external_death)}
+
+PERSON_STEPS = [
+    cleaning_step("person_id", resolve_multiple_person_ids, "001", "id", "Resolving entries with multiple IDs"),
+    CurationStep("names_and_dates", extract_names_and_dates, inputs=["100"], outputs=["name", "birth_date", "death_date"],
+                 message="Extracting names and dates"),
+    CurationStep("external_dates", update_dates_from_external_sources, inputs=["id", "birth_date", "death_date"],
+                 outputs=["birth_date", "death_date"], message="Updating birth and death dates from external sources",
+                 files=[persons_dates_file_path]),
+    CurationStep("gender", lambda df: {"gender": apply_gender_mapping(df["id"])}, inputs=["id"], outputs=["gender"],
+                 drops=["375$a"], message="Cleaning and harmonizing gender identities", files=[persons_gender_file_path]),
+]
+
+def curate_persons(df, max_workers=1, steps=None, cache_dir=None):
+    """
+    Cleans the converted persons dataframe with the steps in PERSON_STEPS (see `run_steps`) and links the persons
+    to VIAF and Wikidata.
+
+    With `steps`, only the steps with these names are run. With `cache_dir`, the outputs of the steps are cached there,
+    and the steps whose inputs have not changed since are not run again.
+    With `max_workers` other than 1, the cleaning runs on partitions of the dataframe in that many processes
+    (all CPUs with None, see `curate_in_partitions`), if the collection is large enough for this to be faster.
+    The authority file of the links is updated in this process.
+    """
+    if max_workers == 1:
+        df, report = curate_persons_partition(df, steps=steps, cache_dir=cache_dir)
+    else:
+        df = curate_in_partitions(df, curate_persons_partition, max_workers=max_workers, steps=steps, cache_dir=cache_dir)
 
     ### Add VIAF and Wikidata links from authority file
     print("Adding VIAF and Wikidata links")
@@ -991,6 +1250,13 @@ def curate_persons(df):
 
     return df
 
+def curate_persons_partition(df, steps=None, cache_dir=None, verbose=True):
+    """
+    Runs the cleaning steps of `curate_persons`, which only depend on the values of each row, on (a partition of) the dataframe.
+    Returns the cleaned dataframe and the step report (see `run_steps`).
+    """
+    return run_steps(df, PERSON_STEPS, names=steps, cache_dir=cache_dir, verbose=verbose)
+
 def organize_columns(df, collection_type, column_names_file_path=column_names_file_path, column_order_file_path=column_order_file_path):
     """Renames columns and orders them according to the specified configuration."""
     with open(column_names_file_path) as f:
@@ -1007,23 +1273,30 @@ def organize_columns(df, collection_type, column_names_file_path=column_names_fi
 if __name__ == "__main__":
 
     key = sys.argv[1]
+    # curate partitions of the dataframe in parallel processes (one per CPU)
+    max_workers = None if "--parallel" in sys.argv[2:] else 1
+    # only run the given curation steps, e.g. --steps=isbn,page_count
+    steps = next((arg.split("=", 1)[1].split(",") for arg in sys.argv[2:] if arg.startswith("--steps=")), None)
+    # reuse the outputs of the curation steps whose inputs have not changed since the last run
+    cache_dir = write_data_path / f"{key}.steps" if "--cache" in sys.argv[2:] else None
     print("Loading data")
     df = load_converted_data(key=key)
 
     if key in ["enb_books", "enb_non_estonian", "enb_all_books"]:
-        df = curate_books(df)
-        df = organize_columns(df, collection_type="books")
+        collection_type = "books"
+        df = curate_books(df, max_workers=max_workers, steps=steps, cache_dir=cache_dir)
     elif key == "persons":
-        df = curate_persons(df)
-        df = organize_columns(df, collection_type="persons")
+        collection_type = "persons"
+        df = curate_persons(df, max_workers=max_workers, steps=steps, cache_dir=cache_dir)
     else:
         print("Warning: some of the columns in this collection do not yet have custom cleaning functions. Cleaning will proceed as if the collection were 'enb_books', but the result may be partially incorrect. Please check 'curate.py' for reference.")
-        df = curate_books(df)
-        df = organize_columns(df, collection_type="books")
+        collection_type = "books"
+        df = curate_books(df, max_workers=max_workers, steps=steps, cache_dir=cache_dir)
+    df = organize_columns(df, collection_type=collection_type)
 
     ### Saving
     savepath = f"{write_data_path}/{key}.parquet"
     print(f"Saving cleaned file to {savepath}")
-    df.to_parquet(savepath)
+    write_curated_parquet(df, savepath, collection_type=collection_type)
     
     print("Finished!")
@@ -0,0 +1,171 @@
+import json
+import time
+from hashlib import blake2b
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+
+class CurationStep():
+    """
+    A named step of the curation, which cleans some input columns of the dataframe into output columns.
+
+    The step is skipped if any of its input columns is missing. The columns in `drops` are dropped after the steps
+    have run (see `run_steps`). A step can be skipped in later runs if neither its input columns, the files it reads
+    nor its version have changed since its outputs were cached.
+
+    Args:
+        name (str): The name of the step, e.g. to select it in `run_steps`.
+        function (callable): Takes the dataframe and returns the output columns, as a dataframe or a dict of columns.
+            It should not modify the dataframe it is given.
+        inputs (list): The columns read by the step.
+        outputs (list): The columns written by the step.
+        drops (list): The columns that are no longer needed after the step.
+        message (str): The progress message printed when the step runs.
+        files (list): The paths of the external files (e.g. authority files in config/) read by the step.
+        version (int): The version of the step, to be increased whenever its code changes.
+
+    Methods:
+        fingerprint(df):
+            Returns a hash of the step version, the input columns of the dataframe and the files read by the step.
+    """
+
+    def __init__(self, name: str, function, inputs: list, outputs: list, drops: list = (), message: str = None,
+                 files: list = (), version: int = 1):
+        self.name = name
+        self.function = function
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.drops = list(drops)
+        self.message = message
+        self.files = [Path(path) for path in files]
+        self.version = version
+
+    def fingerprint(self, df: pd.DataFrame) -> str:
+        fingerprint = blake2b(digest_size=16)
+        fingerprint.update(json.dumps([self.name, self.version, self.inputs, self.outputs, len(df)]).encode())
+        for column in self.inputs:
+            fingerprint.update(hash_column(df[column]))
+        for path in self.files:
+            fingerprint.update(path.read_bytes() if path.exists() else b"")
+        return fingerprint.hexdigest()
+
+
+def hash_column(column: pd.Series) -> bytes:
+    """Returns the hashes of the values of a column. The lists of list columns are hashed by their contents."""
+    try:
+        hashes = pd.util.hash_pandas_object(column, index=False, categorize=False)
+    except (TypeError, ValueError):
+        column = column.map(lambda value: json.dumps(list(value), ensure_ascii=False)
+                            if isinstance(value, (list, tuple, np.ndarray)) else value)
+        hashes = pd.util.hash_pandas_object(column, index=False, categorize=False)
+    return hashes.to_numpy().tobytes()
+
+
+def get_memory_usage(df: pd.DataFrame, columns: list) -> int:
+    """Returns the memory used by the given columns of the dataframe (those that exist) in bytes."""
+    columns = [column for column in columns if column in df.columns]
+    return int(df[columns].memory_usage(index=False, deep=True).sum()) if columns else 0
+
+
+def read_cached_outputs(cache_path: Path, fingerprint: str) -> pd.DataFrame:
+    """Returns the outputs of a step cached with the given fingerprint, or None."""
+    if not cache_path.exists():
+        return None
+    try:
+        cached = pd.read_pickle(cache_path)
+    except Exception:
+        # the cache is only an optimization, e.g. a file written by another pandas version means that the step runs again
+        return None
+    if cached.get("fingerprint") != fingerprint:
+        return None
+    return cached["outputs"]
+
+
+def write_cached_outputs(cache_path: Path, fingerprint: str, outputs: pd.DataFrame) -> None:
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_suffix(".tmp")
+    pd.to_pickle({"fingerprint": fingerprint, "outputs": outputs}, tmp_path)
+    tmp_path.replace(cache_path)
+
+
+def print_report(report: list) -> None:
+    """Prints the status, wall time and memory delta (of the dataframe) of each step."""
+    print(f"\n{'Step':<28}{'Status':<10}{'Time (s)':>10}{'Memory (MB)':>14}")
+    for name, status, seconds, memory_delta in report:
+        print(f"{name:<28}{status:<10}{seconds:>10.2f}{memory_delta / 1e6:>+14.1f}")
+
+
+def merge_reports(reports: list) -> list:
+    """
+    Combines the reports of the same steps run on the partitions of a dataframe (see `run_steps`) into one report.
+    The times and memory deltas are summed over the partitions. A step is reported as cached or skipped only if
+    it was in all the partitions.
+    """
+    merged = []
+    for rows in zip(*reports):
+        statuses = {status for name, status, seconds, memory_delta in rows}
+        status = statuses.pop() if len(statuses) == 1 else "run"
+        merged.append((rows[0][0], status, sum(row[2] for row in rows), sum(row[3] for row in rows)))
+    return merged
+
+
+def run_steps(df: pd.DataFrame, steps: list, names: list = None, cache_dir=None, verbose: bool = True) -> tuple:
+    """
+    Runs curation steps on the dataframe in order and reports the wall time and the memory delta of the dataframe of each step.
+
+    The dataframe given is left unchanged: it is copied once, the columns that are no longer needed are dropped
+    once, after all the steps have run, rather than copying the dataframe after each step.
+
+    Args:
+        df (pd.DataFrame): The dataframe to curate.
+        steps (list): The `CurationStep`s to run.
+        names (list): The names of the steps to run, all of them if None. The other steps are skipped.
+        cache_dir (str): A directory to cache the outputs of each step in, if given. A step whose input columns, files
+            and version are the same as in the cached run is not run again, its cached outputs are used instead.
+        verbose (bool): Whether to print the progress messages of the steps and the report. The messages of the
+            cleaners themselves (e.g. about values that could not be processed) are always printed.
+
+    Returns:
+        tuple: The curated dataframe and the report, a list of (step name, status, wall time in seconds, memory delta in bytes).
+    """
+    if names is not None:
+        unknown = set(names) - {step.name for step in steps}
+        if unknown:
+            raise ValueError(f"Unknown curation steps: {', '.join(sorted(unknown))}. Valid steps are: {[step.name for step in steps]}")
+
+    df = df.copy()
+    report = []
+    drops = []
+    for step in steps:
+        if names is not None and step.name not in names:
+            continue
+        if not all(column in df.columns for column in step.inputs):
+            report.append((step.name, "skipped", 0.0, 0))
+            continue
+
+        start_time = time.perf_counter()
+        memory_before = get_memory_usage(df, step.outputs)
+        cache_path = fingerprint = outputs = None
+        if cache_dir is not None:
+            cache_path = Path(cache_dir) / f"{step.name}.pkl"
+            fingerprint = step.fingerprint(df)
+            outputs = read_cached_outputs(cache_path, fingerprint)
+        status = "cached" if outputs is not None else "run"
+
+        if outputs is None:
+            if step.message and verbose:
+                print(step.message)
+            outputs = step.function(df)
+        for column in step.outputs:
+            df[column] = outputs[column]
+        if cache_path is not None and status == "run":
+            write_cached_outputs(cache_path, fingerprint, df[step.outputs])
+
+        drops.extend(column for column in step.drops if column not in drops)
+        report.append((step.name, status, time.perf_counter() - start_time, get_memory_usage(df, step.outputs) - memory_before))
+
+    df = df.drop(columns=[column for column in drops if column in df.columns])
+    if verbose:
+        print_report(report)
+    return df, report
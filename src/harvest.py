@@ -1,9 +1,25 @@
+import os
 import json
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+from datetime import date, timedelta
 from tqdm import tqdm
 from pathlib import Path
-import requests
 from lxml import etree
 
+if __name__ == "__main__":
+    # when using this script from command line
+    import http_session
+    from compression import RawFileWriter, get_suffix
+    from convert import ParquetRecordSink, parse_oai_record
+else:
+    # when using the harvest functions as imported
+    from src import http_session
+    from src.compression import RawFileWriter, get_suffix
+    from src.convert import ParquetRecordSink, parse_oai_record
+
 # Path to the current script
 current_script_path = Path(__file__)
 # Path to the project root
@@ -12,6 +28,17 @@ project_root = current_script_path.parent.parent
 write_data_path = project_root / "data" / "raw"
 # Path to the collections.json file in the config directory
 collections_file_path = project_root / "config" / "collections.json"
+# Path to the file storing the datestamp of the last successful harvest per collection
+harvest_state_file_path = write_data_path / "harvest_state.json"
+# Serializes the updates of the harvest state file by collections harvested concurrently
+harvest_state_lock = threading.Lock()
+
+# OAI-PMH endpoint used for resumptionToken requests when no collection URL is known
+DEFAULT_ENDPOINT = "https://data.digar.ee/repox/OAIHandler"
+# Maximum number of collections harvested at the same time from one OAI-PMH host
+MAX_HARVESTS_PER_HOST = 2
+# Maximum number of records per shard in sharded harvesting
+MAX_SHARD_RECORDS = 50000
 
 with open(collections_file_path, "r", encoding="utf8") as f:
     collections = json.load(f)
@@ -25,20 +52,38 @@ ns = {
 for prefix, uri in ns.items():
     etree.register_namespace(prefix, uri)
 
+OAI_RECORD_TAG = "{http://www.openarchives.org/OAI/2.0/}record"
+OAI_LISTRECORDS_TAG = "{http://www.openarchives.org/OAI/2.0/}ListRecords"
+OAI_RESUMPTIONTOKEN_TAG = "{http://www.openarchives.org/OAI/2.0/}resumptionToken"
+OAI_RESPONSEDATE_TAG = "{http://www.openarchives.org/OAI/2.0/}responseDate"
+OAI_REQUEST_TAG = "{http://www.openarchives.org/OAI/2.0/}request"
+
 
-def request_records(collection_URL=None, token=None):
+def get_endpoint(URL: str) -> str:
+    """Returns the OAI-PMH endpoint (the URL without the request arguments) of a request URL."""
+    return URL.split("?")[0]
+
+
+def get_request_url(collection_URL=None, token=None, endpoint=DEFAULT_ENDPOINT):
     """
-    Sends a request to the OAI-PMH endpoint and retrieves the ListRecords element and resumptionToken.
+    Returns the URL of a ListRecords request for either the first page of a collection or a resumptionToken.
     """
-    # Determine the URL to use
     if token is not None and collection_URL is None:
-        URL = f"https://data.digar.ee/repox/OAIHandler?verb=ListRecords&resumptionToken={token}"
+        return f"{endpoint}?verb=ListRecords&resumptionToken={token}"
     elif collection_URL is not None and token is None:
-        URL = collection_URL
+        return collection_URL
     else:
         raise AttributeError("Must provide either a resumptionToken or a collection URL")
 
-    response = requests.get(URL)
+
+def request_records(collection_URL=None, token=None, endpoint=DEFAULT_ENDPOINT):
+    """
+    Sends a request to the OAI-PMH endpoint and retrieves the ListRecords element and resumptionToken.
+    """
+    URL = get_request_url(collection_URL=collection_URL, token=token, endpoint=endpoint)
+
+    response = http_session.get(URL)
+    response.raise_for_status()
     root = etree.fromstring(response.content)
 
     # Get the ListRecords element
@@ -53,92 +98,331 @@ def request_records(collection_URL=None, token=None):
     return root, ListRecords, resumptionToken
 
 
-def harvest_and_write_records(URL, savepath, verbose=True):
+def stream_records(collection_URL=None, token=None, endpoint=DEFAULT_ENDPOINT, chunk_size=65536):
+    """
+    Sends a request to the OAI-PMH endpoint and parses the response incrementally while it is being downloaded.
+
+    Yields ("header", metadata) once the responseDate and request elements have been parsed, then ("record", bytes)
+    with each serialized record as soon as it is complete, and finally ("resumptionToken", token) at the end of the page.
+    """
+    URL = get_request_url(collection_URL=collection_URL, token=token, endpoint=endpoint)
+
+    response = http_session.get(URL, stream=True)
+    response.raise_for_status()
+
+    parser = etree.XMLPullParser(events=("end",))
+    request_metadata = {}
+    resumptionToken = None
+    with response:
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            parser.feed(chunk)
+            for event, elem in parser.read_events():
+                if elem.tag == OAI_RECORD_TAG and elem.getparent().tag == OAI_LISTRECORDS_TAG:
+                    yield "record", etree.tostring(elem, encoding="utf8", pretty_print=True)
+                    # Free the memory of the records that have already been emitted
+                    elem.clear()
+                    while elem.getprevious() is not None:
+                        del elem.getparent()[0]
+                elif elem.tag == OAI_RESUMPTIONTOKEN_TAG:
+                    resumptionToken = elem.text
+                elif elem.tag in (OAI_RESPONSEDATE_TAG, OAI_REQUEST_TAG):
+                    request_metadata[etree.QName(elem).localname] = elem
+                    if len(request_metadata) == 2:
+                        yield "header", request_metadata
+        root = parser.close()
+
+    check_oai_error(root)
+    yield "resumptionToken", resumptionToken
+
+
+def check_oai_error(root):
+    """
+    Raises an error if the OAI-PMH response contains an error element (other than an empty result set).
+    """
+    error = root.find("./oai:error", namespaces=ns)
+    if error is not None and error.get("code") != "noRecordsMatch":
+        raise RuntimeError(f"OAI-PMH error '{error.get('code')}': {error.text}")
+
+
+def get_checkpoint_path(savepath):
+    """Returns the path of the checkpoint file kept alongside a raw XML file during harvesting."""
+    return Path(f"{savepath}.checkpoint.json")
+
+
+def read_checkpoint(savepath):
+    """Reads the harvesting checkpoint of a raw XML file, or returns None if there is none."""
+    checkpoint_path = get_checkpoint_path(savepath)
+    if not checkpoint_path.exists():
+        return None
+    with open(checkpoint_path, "r", encoding="utf8") as f:
+        return json.load(f)
+
+
+def write_checkpoint(savepath, checkpoint: dict):
+    """Atomically replaces the harvesting checkpoint of a raw XML file."""
+    checkpoint_path = get_checkpoint_path(savepath)
+    tmp_path = checkpoint_path.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf8") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, checkpoint_path)
+
+
+def get_collection_size(token):
+    """Extracts the complete list size from a Repox resumptionToken, if present."""
+    if token is None:
+        return None
+    token_parts = token.strip(":").split(":")
+    if len(token_parts) >= 5:
+        return int(token_parts[4])
+    return None
+
+
+def load_harvest_state() -> dict:
+    """Loads the datestamps of the last successful harvest of each collection."""
+    if not harvest_state_file_path.exists():
+        return {}
+    with open(harvest_state_file_path, "r", encoding="utf8") as f:
+        return json.load(f)
+
+
+def save_harvest_state(key: str, response_date: str) -> None:
+    """
+    Stores the responseDate of a successful harvest of a collection, to be used as the `from` datestamp of the next
+    incremental harvest. Should be called only after the harvested data has been merged into the converted file.
+    Safe to call from the threads of `harvest_many`.
+    """
+    with harvest_state_lock:
+        state = load_harvest_state()
+        # The server's own clock is used and the date is truncated to day granularity,
+        # so the next incremental harvest overlaps the previous one by at most a day
+        state[key] = response_date[:10]
+        tmp_path = harvest_state_file_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf8") as f:
+            json.dump(state, f, indent=4)
+        os.replace(tmp_path, harvest_state_file_path)
+
+
+def build_harvest_url(URL: str, from_date: str = None, until_date: str = None) -> str:
+    """Adds OAI-PMH `from` and `until` datestamp arguments to a ListRecords URL."""
+    if from_date is not None:
+        URL += f"&from={from_date}"
+    if until_date is not None:
+        URL += f"&until={until_date}"
+    return URL
+
+
+class RecordPrefetcher():
+    """
+    Streams the records of a harvest in a background thread, so that the next page is downloaded
+    while the records of the current one are being written.
+
+    The thread runs at most `prefetch` pages ahead of the consumer, which bounds the memory held in the queue.
+
+    Args:
+        URL (str): The URL of the first page to fetch (None when continuing from a resumptionToken).
+        token (str): The resumptionToken of the first page to fetch (None when starting from a URL).
+        prefetch (int): The maximum number of pages fetched ahead of the consumer.
+        endpoint (str): The OAI-PMH endpoint for resumptionToken requests.
+
+    Iterating over the prefetcher yields the items of `stream_records` for consecutive pages, re-raising any
+    error of the fetching thread, and stops after the last page.
+    """
+
+    def __init__(self, URL=None, token=None, prefetch: int = 2, endpoint: str = DEFAULT_ENDPOINT):
+        self.endpoint = endpoint
+        self.items = queue.Queue()
+        self.page_slots = threading.Semaphore(prefetch)
+        self.stopped = threading.Event()
+        self.has_pages = URL is not None or token is not None
+        self.thread = threading.Thread(target=self.fetch, args=(URL, token), daemon=True)
+        if self.has_pages:
+            self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __iter__(self):
+        if not self.has_pages:
+            return
+        while True:
+            item = self.items.get()
+            if isinstance(item, Exception):
+                raise item
+            yield item
+            if item[0] == "resumptionToken":
+                self.page_slots.release()
+                if item[1] is None:
+                    return
+
+    def fetch(self, URL, token):
+        try:
+            while URL is not None or token is not None:
+                if not self.acquire_page_slot():
+                    return
+                for item in stream_records(collection_URL=URL, token=token, endpoint=self.endpoint):
+                    if self.stopped.is_set():
+                        return
+                    self.items.put(item)
+                    if item[0] == "resumptionToken":
+                        token = item[1]
+                URL = None
+        except Exception as e:
+            self.items.put(e)
+
+    def acquire_page_slot(self):
+        # wait until the consumer has finished an earlier page, unless it has stopped
+        while not self.stopped.is_set():
+            if self.page_slots.acquire(timeout=1):
+                return True
+        return False
+
+    def close(self):
+        self.stopped.set()
+
+
+def harvest_and_write_records(URL, savepath, verbose=True, resume=False, checkpoint_every=10, prefetch=2, desc=None, position=None,
+                              record_callback=None, checkpoint_callback=None):
     """
     Harvests records from the OAI-PMH endpoint and writes them directly to the XML file without storing all records in memory.
+
+    Every `checkpoint_every` pages the file is flushed and the last committed resumptionToken, record count and
+    file offset are saved to a checkpoint file next to the XML. With `resume=True`, an interrupted harvest is
+    continued from the checkpoint: the file is truncated to the last committed offset and harvesting
+    continues from the saved resumptionToken. The checkpoint is removed once the harvest completes.
+
+    Responses are parsed while they are downloaded and each record is written as soon as it is complete.
+    Up to `prefetch` pages are requested ahead in a background thread while the current page is written.
+    `desc` and `position` are passed to the progress bar (used when several harvests run at once).
+
+    If `savepath` ends with .gz or .zst, the file is compressed while it is written (see `compression.RawFileWriter`).
+    If `record_callback` is given, it is called with each serialized record as it is written. With `savepath=None`,
+    the records are only passed to the callback and no XML file is written (resuming is then not possible).
+    If `checkpoint_callback` is given, it is called at each checkpoint, after the records of the committed pages have
+    been passed to `record_callback`, and the state it returns is saved in the checkpoint (as "callback_state").
+
+    Returns the responseDate of the first response of the harvest.
     """
-    # Open the file and write the start of the XML document
-    with open(savepath, "w", encoding="utf8") as f:
-        # Initial request
-        root, ListRecords, resumptionToken = request_records(collection_URL=URL)
-
-        # Get responseDate and request elements for the XML header
-        responseDate = root.find("./oai:responseDate", namespaces=ns)
-        request_element = root.find("./oai:request", namespaces=ns)
-        request_metadata = {
-            "responseDate": responseDate,
-            "request": request_element,
-        }
-
-        # Write the XML header
-        f.write(write_start_of_string(request_metadata))
-        f.write("<ListRecords>\n")
-
-        # Initialize progress bar and token
-        if ListRecords is not None:
-            records = ListRecords.findall("./oai:record", namespaces=ns)
-            token = resumptionToken
-            if token is not None:
-                token_parts = token.strip(":").split(":")
-                if len(token_parts) >= 5:
-                    collection_size = int(token_parts[4])
-                    total_records = collection_size
-                else:
-                    total_records = None
-            else:
-                total_records = len(records)
-        else:
-            records = []
-            token = None
-            total_records = 0
+    if savepath is None and resume:
+        raise ValueError("Resuming a harvest requires the raw XML file (savepath)")
+    checkpoint = read_checkpoint(savepath) if resume else None
+    if checkpoint is not None and checkpoint["URL"] != URL:
+        raise ValueError(f"The checkpoint for {savepath} belongs to a different harvest ({checkpoint['URL']})")
+
+    if checkpoint is not None:
+        # Continue from the last committed page, discarding anything written after it
+        f = RawFileWriter(savepath, offset=checkpoint["offset"])
+        first_URL = None
+        token = checkpoint["resumptionToken"]
+        records_written = checkpoint["records_written"]
+        total_records = checkpoint["total_records"]
+        response_date = checkpoint["responseDate"]
+        if verbose:
+            print(f"Resuming harvest from record {records_written}")
+    else:
+        if resume and verbose:
+            print(f"No checkpoint found for {savepath}, starting a new harvest")
+        f = RawFileWriter(savepath)
+        first_URL = URL
+        token = None
+        records_written = 0
+        total_records = None
+        response_date = None
 
+    with f, RecordPrefetcher(URL=first_URL, token=token, prefetch=prefetch, endpoint=get_endpoint(URL)) as stream:
         if verbose:
-            if total_records is not None:
-                progress_bar = tqdm(total=total_records)
-                progress_bar.update(len(records))
-            else:
-                progress_bar = tqdm()
+            progress_bar = tqdm(total=total_records, initial=records_written, desc=desc, position=position)
         else:
             progress_bar = None
 
-        # Write the initial records
-        for record in records:
-            entry_as_string = etree.tostring(
-                record,
-                encoding="utf8",
-                pretty_print=True,
-            ).decode()
-            f.write(entry_as_string)
-            if progress_bar:
-                progress_bar.update(1)
-
-        # Harvest and write subsequent records
-        while token is not None:
-            # Request the next batch of records using the resumptionToken
-            root, ListRecords, resumptionToken = request_records(token=token)
-            if ListRecords is not None:
-                records = ListRecords.findall("./oai:record", namespaces=ns)
-                for record in records:
-                    entry_as_string = etree.tostring(
-                        record,
-                        encoding="utf8",
-                        pretty_print=True,
-                    ).decode()
-                    f.write(entry_as_string)
-                    if progress_bar:
-                        progress_bar.update(1)
-                # Update the token with the new resumptionToken from the response
-                token = resumptionToken
-            else:
-                token = None
+        pages_written = 0
+        for kind, value in stream:
+            if kind == "header":
+                if response_date is None:
+                    # Write the XML header from the first response
+                    response_date = value["responseDate"].text
+                    f.write(write_start_of_string(value).encode("utf8"))
+                    f.write(b"<ListRecords>\n")
+
+            elif kind == "record":
+                f.write(value)
+                if record_callback is not None:
+                    record_callback(value)
+                records_written += 1
+                if progress_bar is not None:
+                    progress_bar.update(1)
+
+            elif kind == "resumptionToken":
+                token = value
+                pages_written += 1
+
+                # The collection size is known once the first page has been read
+                if total_records is None:
+                    total_records = get_collection_size(token) if token is not None else records_written
+                    if progress_bar is not None:
+                        progress_bar.total = total_records
+                        progress_bar.refresh()
+
+                # Commit the page so that an interrupted harvest can be resumed from here
+                if pages_written % checkpoint_every == 0 and token is not None and savepath is not None:
+                    offset = f.commit()
+                    write_checkpoint(savepath, {
+                        "URL": URL,
+                        "resumptionToken": token,
+                        "records_written": records_written,
+                        "offset": offset,
+                        "total_records": total_records,
+                        "responseDate": response_date,
+                        "callback_state": checkpoint_callback() if checkpoint_callback is not None else None,
+                    })
 
         # Close the XML document
-        f.write("</ListRecords>\n")
-        f.write("</OAI-PMH>")
+        f.write(b"</ListRecords>\n")
+        f.write(b"</OAI-PMH>")
 
-        if progress_bar:
+        if progress_bar is not None:
             progress_bar.close()
 
+    if savepath is not None:
+        get_checkpoint_path(savepath).unlink(missing_ok=True)
+    return response_date
+
+
+def harvest_to_parquet(URL, parquet_path, savepath=None, batch_size=10000, columns=None, list_columns=None, **kwargs):
+    """
+    Harvests records and converts them on the fly, appending them in batches to a parquet file (see `convert.ParquetRecordSink`).
+    This skips the separate conversion step and its passes over the raw XML file. The raw XML can still be kept
+    for archival by giving `savepath`. With `columns`, only these MARC paths are extracted (see `convert.get_marc_projection`),
+    and the MARC paths in `list_columns` are written as list columns (see `convert.get_list_columns`).
+    Other keyword arguments are passed to `harvest_and_write_records`.
+
+    With `resume=True`, an interrupted harvest is continued from its checkpoint, which requires `savepath`: the parts
+    of the parquet file committed with the checkpoint are kept and the records harvested after it are discarded.
+
+    Returns the responseDate of the harvest.
+    """
+    resume = kwargs.pop("resume", False)
+    if resume and savepath is None:
+        raise ValueError("Resuming a harvest to parquet requires the raw XML file (savepath), which holds the checkpoints")
+    checkpoint = read_checkpoint(savepath) if resume else None
+    sink_state = None
+    if checkpoint is not None:
+        sink_state = checkpoint.get("callback_state")
+        if sink_state is None:
+            raise ValueError(f"The checkpoint for {savepath} does not belong to a harvest to parquet")
+
+    with ParquetRecordSink(parquet_path, batch_size=batch_size, resume_state=sink_state,
+                           resumable=savepath is not None) as sink:
+        def convert_record(record_xml):
+            record = parse_oai_record(record_xml, columns=columns, list_columns=list_columns)
+            if record is not None:
+                sink.write(record)
+        response_date = harvest_and_write_records(URL=URL, savepath=savepath, resume=resume, record_callback=convert_record,
+                                                  checkpoint_callback=sink.commit, **kwargs)
+    return response_date
+
 
 def write_start_of_string(metadata: dict) -> str:
     """
@@ -150,17 +434,192 @@ def write_start_of_string(metadata: dict) -> str:
     return xml_string
 
 
-def harvest_oai(key: str, savepath: str) -> None:
+def identify(URL: str):
     """
-    Harvests metadata records from an OAI-PMH endpoint for a given collection and writes them to a file.
+    Sends an Identify request to the OAI-PMH endpoint of a ListRecords URL and returns the root of the response.
+    """
+    response = http_session.get(f"{get_endpoint(URL)}?verb=Identify")
+    response.raise_for_status()
+    root = etree.fromstring(response.content)
+    check_oai_error(root)
+    return root
+
+
+def count_window_records(URL: str, from_date: str, until_date: str) -> int:
+    """
+    Returns the number of records in a datestamp window of a collection, as reported by the first page of its harvest.
+    """
+    root, ListRecords, resumptionToken = request_records(collection_URL=build_harvest_url(URL, from_date, until_date))
+    check_oai_error(root)
+    if ListRecords is None:
+        return 0
+    collection_size = get_collection_size(resumptionToken)
+    if collection_size is None:
+        # the whole window fits on one page (or the server does not report the list size)
+        collection_size = len(ListRecords.findall("./oai:record", namespaces=ns))
+    return collection_size
+
+
+def plan_date_shards(URL: str, from_date: str, until_date: str, max_shard_records: int = MAX_SHARD_RECORDS) -> list:
+    """
+    Splits the datestamp range [from_date, until_date] of a collection into windows of at most `max_shard_records` records.
+    Windows that are too big are halved until they fit or span a single day; empty windows are left out.
+    """
+    records = count_window_records(URL, from_date, until_date)
+    start = date.fromisoformat(from_date)
+    end = date.fromisoformat(until_date)
+    if records <= max_shard_records or start == end:
+        return [{"from": from_date, "until": until_date, "records": records}] if records > 0 else []
+
+    # OAI-PMH datestamp ranges are inclusive, so the second half starts on the day after the middle
+    middle = start + (end - start) // 2
+    return (plan_date_shards(URL, from_date, middle.isoformat(), max_shard_records)
+            + plan_date_shards(URL, (middle + timedelta(days=1)).isoformat(), until_date, max_shard_records))
+
+
+def harvest_sharded(key: str, savedir: str, from_date: str = None, until_date: str = None,
+                    max_shard_records: int = MAX_SHARD_RECORDS, workers: int = 4, compression: str = None,
+                    verbose: bool = True) -> str:
+    """
+    Harvests a collection in parallel by splitting it into datestamp windows, each harvested into its own shard file.
+
+    The shards and their record counts are described in `manifest.json` in `savedir`. If the manifest of an unfinished
+    sharded harvest of the same collection exists, the harvest is resumed: finished shards are skipped and
+    interrupted shards continue from their checkpoints. The shards can be compressed with `compression` ('gzip' or 'zstd').
+
+    Returns the responseDate of the harvest.
     """
     URL = collections[key]["OAI-PMH"]
-    harvest_and_write_records(URL=URL, savepath=savepath)
+    savedir = Path(savedir)
+    savedir.mkdir(parents=True, exist_ok=True)
+    manifest_path = savedir / "manifest.json"
+
+    manifest = None
+    if manifest_path.exists():
+        with open(manifest_path, "r", encoding="utf8") as f:
+            manifest = json.load(f)
+        if manifest["URL"] != URL or all(shard["complete"] for shard in manifest["shards"]):
+            manifest = None
+
+    if manifest is None:
+        root = identify(URL)
+        response_date = root.findtext("./oai:responseDate", namespaces=ns)
+        if from_date is None:
+            from_date = root.findtext("./oai:Identify/oai:earliestDatestamp", namespaces=ns)[:10]
+        if until_date is None:
+            until_date = response_date[:10]
+        if verbose:
+            print(f"Splitting {key} into shards of at most {max_shard_records} records")
+        shards = plan_date_shards(URL, from_date, until_date, max_shard_records)
+        for i, shard in enumerate(shards):
+            shard["path"] = f"shard_{i:04d}{get_suffix(compression)}"
+            shard["complete"] = False
+        manifest = {"key": key, "URL": URL, "responseDate": response_date, "shards": shards}
+    elif verbose:
+        print(f"Resuming the sharded harvest of {key}")
+
+    manifest_lock = threading.Lock()
+
+    def write_manifest():
+        tmp_path = manifest_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf8") as f:
+            json.dump(manifest, f, indent=4)
+        os.replace(tmp_path, manifest_path)
+
+    write_manifest()
+    pending = [shard for shard in manifest["shards"] if not shard["complete"]]
+    progress_bar = tqdm(total=sum(shard["records"] for shard in pending), desc=key) if verbose else None
+
+    def harvest_shard(shard):
+        harvest_and_write_records(URL=build_harvest_url(URL, shard["from"], shard["until"]),
+                                  savepath=savedir / shard["path"], verbose=False, resume=True)
+        with manifest_lock:
+            shard["complete"] = True
+            write_manifest()
+            if progress_bar is not None:
+                progress_bar.update(shard["records"])
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for future in [executor.submit(harvest_shard, shard) for shard in pending]:
+            future.result()
+
+    if progress_bar is not None:
+        progress_bar.close()
+    return manifest["responseDate"]
+
+
+def harvest_oai(key: str, savepath: str, resume: bool = False, incremental: bool = False, until_date: str = None,
+                position: int = None, sharded: bool = False, compression: str = None, parquet_path: str = None,
+                columns: set = None, list_columns: set = None) -> str:
+    """
+    Harvests metadata records from an OAI-PMH endpoint for a given collection and writes them to a file.
+    With `resume=True`, an interrupted harvest into the same file is continued from its last checkpoint.
+    With `incremental=True`, only records changed (or deleted) since the last successful harvest of the collection
+    are harvested. If the collection has not been harvested before, the whole collection is harvested.
+    With `sharded=True`, the collection is harvested in parallel datestamp windows into shard files in the
+    directory `savepath` (see `harvest_sharded`); sharded harvests are always resumed if unfinished.
+    The raw XML is compressed if `savepath` ends with .gz or .zst, or, for sharded harvests, if `compression` is given.
+    With `parquet_path`, the records are converted during the harvest and written directly to that parquet file
+    (see `harvest_to_parquet`); `savepath` can then be None to skip writing the raw XML, but only harvests with
+    `savepath` can be resumed. `columns` limits the
+    converted MARC paths of the parquet file and `list_columns` are the MARC paths written as list columns.
+
+    Returns the responseDate of the harvest, to be stored with `save_harvest_state` once the data has been processed.
+    """
+    from_date = None
+    if incremental:
+        from_date = load_harvest_state().get(key)
+        if from_date is None:
+            print(f"No previous harvest of {key} found, harvesting the whole collection")
+    if sharded:
+        return harvest_sharded(key=key, savedir=savepath, from_date=from_date, until_date=until_date, compression=compression)
+    URL = build_harvest_url(collections[key]["OAI-PMH"], from_date=from_date, until_date=until_date)
+    if parquet_path is not None:
+        return harvest_to_parquet(URL=URL, parquet_path=parquet_path, savepath=savepath, columns=columns,
+                                  list_columns=list_columns, resume=resume, desc=key, position=position)
+    return harvest_and_write_records(URL=URL, savepath=savepath, resume=resume, desc=key, position=position)
+
+
+def harvest_many(jobs: dict, on_harvested=None, max_per_host: int = MAX_HARVESTS_PER_HOST) -> dict:
+    """
+    Harvests several collections concurrently, with at most `max_per_host` harvests running against the same OAI-PMH host.
+
+    Args:
+        jobs (dict): A mapping of collection keys to keyword arguments of `harvest_oai` (at least `savepath`).
+        on_harvested (callable): Called as on_harvested(key, response_date) as soon as a collection has been harvested,
+            so that e.g. its conversion can start while the other collections are still downloading.
+        max_per_host (int): The maximum number of concurrent harvests per host.
+
+    Returns:
+        dict: The results of `on_harvested` (or the responseDates, if no callback is given) per collection key, in the order of `jobs`.
+    """
+    host_slots = {}
+    for key in jobs:
+        host = urlparse(collections[key]["OAI-PMH"]).netloc
+        host_slots.setdefault(host, threading.Semaphore(max_per_host))
+
+    def run(position, key):
+        host = urlparse(collections[key]["OAI-PMH"]).netloc
+        with host_slots[host]:
+            response_date = harvest_oai(key=key, position=position, **jobs[key])
+        # the host slot is released before processing, so the next harvest can start meanwhile
+        if on_harvested is not None:
+            return on_harvested(key, response_date)
+        return response_date
+
+    with ThreadPoolExecutor(max_workers=max(len(jobs), 1)) as executor:
+        futures = {key: executor.submit(run, position, key) for position, key in enumerate(jobs)}
+        return {key: future.result() for key, future in futures.items()}
 
 
 if __name__ == "__main__":
     import sys
 
     key = sys.argv[1]
+    resume = "--resume" in sys.argv[2:]
+    compression = "gzip" if "--gzip" in sys.argv[2:] else "zstd" if "--zstd" in sys.argv[2:] else None
     print(f"Harvesting {collections[key]['title']}")
-    harvest_oai(key=key, savepath=f"{write_data_path}/{key}.xml")
\ No newline at end of file
+    if "--sharded" in sys.argv[2:]:
+        harvest_oai(key=key, savepath=f"{write_data_path}/{key}", sharded=True, compression=compression)
+    else:
+        harvest_oai(key=key, savepath=f"{write_data_path}/{key}{get_suffix(compression)}", resume=resume)
\ No newline at end of file
@@ -0,0 +1,95 @@
+import threading
+import time
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Default settings for all HTTP requests of the pipeline, can be changed with configure()
+settings = {
+    # (connect, read) timeouts in seconds
+    "timeout": (10, 300),
+    # number of retries on connection errors and the status codes below
+    "retries": 5,
+    "retry_status_codes": (429, 500, 502, 503, 504),
+    # exponential backoff between retries: backoff_factor * 2 ** (retry - 1) seconds, unless the server sends Retry-After
+    "backoff_factor": 2,
+    # number of keep-alive connections kept per host
+    "pool_maxsize": 10,
+    # minimum number of seconds between two requests to the same host
+    "rate_limits": {
+        "www.viaf.org": 0.2,
+    },
+}
+
+_local = threading.local()
+_generation = 0
+_rate_limit_lock = threading.Lock()
+_last_request_times = {}
+
+
+def configure(**kwargs) -> None:
+    """
+    Updates the HTTP settings (see `settings` for the available keys).
+    Sessions created before the change are replaced on their next use.
+    """
+    global _generation
+    unknown = set(kwargs) - set(settings)
+    if unknown:
+        raise ValueError(f"Unknown HTTP settings: {sorted(unknown)}")
+    settings.update(kwargs)
+    _generation += 1
+
+
+def get_session() -> requests.Session:
+    """
+    Returns the pooled session of the current thread, creating it if needed.
+    Each thread keeps its own session, so keep-alive connections are reused across requests without sharing state between threads.
+    """
+    session = getattr(_local, "session", None)
+    if session is None or _local.generation != _generation:
+        if session is not None:
+            session.close()
+        retry = Retry(
+            total=settings["retries"],
+            backoff_factor=settings["backoff_factor"],
+            status_forcelist=settings["retry_status_codes"],
+            allowed_methods=["GET"],
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_maxsize=settings["pool_maxsize"], max_retries=retry)
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers.update({
+            "Accept-Encoding": "gzip, deflate",
+            "User-Agent": "enb-curator (https://github.com/RaRa-digiLab/enb-curator)",
+        })
+        _local.session = session
+        _local.generation = _generation
+    return session
+
+
+def wait_for_rate_limit(host: str) -> None:
+    """Sleeps until the minimum interval since the previous request to the host has passed."""
+    min_interval = settings["rate_limits"].get(host)
+    if not min_interval:
+        return
+    with _rate_limit_lock:
+        now = time.monotonic()
+        next_allowed = _last_request_times.get(host, 0) + min_interval
+        # reserve the next slot before releasing the lock, so concurrent threads queue up behind each other
+        _last_request_times[host] = max(now, next_allowed)
+    if next_allowed > now:
+        time.sleep(next_allowed - now)
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    """
+    Sends a GET request through the pooled session of the current thread, applying the configured timeout,
+    retries with exponential backoff (honouring Retry-After) and the per-host rate limit.
+    """
+    wait_for_rate_limit(urlparse(url).netloc)
+    kwargs.setdefault("timeout", settings["timeout"])
+    return get_session().get(url, **kwargs)
@@ -0,0 +1,102 @@
+import json
+import re
+import sqlite3
+from hashlib import blake2b
+from pathlib import Path
+
+# The OAI-PMH identifier in the header of an OAI-PMH record, or the control number of a MARC21XML record
+IDENTIFIER_PATTERN = re.compile(rb"<(?:[A-Za-z_][\w.\-]*:)?identifier>\s*([^<]*?)\s*</")
+CONTROL_NUMBER_PATTERN = re.compile(rb"<(?:[A-Za-z_][\w.\-]*:)?controlfield\s+tag=[\"']001[\"'][^>]*>\s*([^<]*?)\s*</")
+
+# Number of bytes of the record hashes
+HASH_SIZE = 16
+
+
+def get_record_identifier(record_xml: bytes) -> str:
+    """
+    Returns the identifier of a serialized record without parsing it: the OAI-PMH identifier of an OAI-PMH record,
+    or the control number (field 001) of a MARC21XML record. Records without either are identified by their hash.
+    """
+    match = IDENTIFIER_PATTERN.search(record_xml) or CONTROL_NUMBER_PATTERN.search(record_xml)
+    if match is None:
+        return None
+    return match.group(1).decode("utf8", errors="replace")
+
+
+def get_record_hash(record_xml: bytes, prefix: bytes = b"") -> bytes:
+    """Returns the hash of a serialized record, including the `prefix` it is parsed with (e.g. the root element)."""
+    record_hash = blake2b(prefix, digest_size=HASH_SIZE)
+    record_hash.update(record_xml)
+    return record_hash.digest()
+
+
+class RecordCache():
+    """
+    A persistent cache of parsed records in an SQLite database, keyed by the record identifier and the parser key.
+
+    A cached record is reused only if the hash of the serialized record is unchanged, so that records changed since
+    they were cached are parsed again. The parser key (see `convert.get_parser_key`) holds the parser version and the
+    parsing options, so records parsed by another version of the parser or with other options are not reused.
+    Only the latest version of each record is kept, and only for the current parser key: the records of other parser keys
+    are deleted when the cache is opened for writing.
+
+    The cache is written by a single process, while worker processes can open it read-only to look up their records.
+
+    Args:
+        path (str): The path of the SQLite database, created if it does not exist.
+        parser_key (str): The parser version and options of the cached records.
+        readonly (bool): Whether to open the existing database read-only.
+
+    Methods:
+        lookup(identifier, record_hash):
+            Returns the cached record with the given identifier and hash, or None.
+
+        store(entries):
+            Stores (identifier, hash, record) entries, replacing older versions of the records.
+
+        close():
+            Commits and closes the database.
+    """
+
+    def __init__(self, path, parser_key: str, readonly: bool = False):
+        self.path = Path(path)
+        self.parser_key = parser_key
+        if readonly:
+            self.connection = sqlite3.connect(f"{self.path.resolve().as_uri()}?mode=ro", uri=True)
+        else:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.connection = sqlite3.connect(self.path)
+            # readers in the worker processes do not block the writer
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("""CREATE TABLE IF NOT EXISTS records (
+                                           parser_key TEXT NOT NULL,
+                                           identifier TEXT NOT NULL,
+                                           hash BLOB NOT NULL,
+                                           data TEXT NOT NULL,
+                                           PRIMARY KEY (parser_key, identifier))""")
+            # records of an older parser version or other options would never be read again
+            self.connection.execute("DELETE FROM records WHERE parser_key != ?", (parser_key,))
+            self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def lookup(self, identifier: str, record_hash: bytes) -> dict:
+        row = self.connection.execute("SELECT hash, data FROM records WHERE parser_key = ? AND identifier = ?",
+                                      (self.parser_key, identifier)).fetchone()
+        if row is None or row[0] != record_hash:
+            return None
+        return json.loads(row[1])
+
+    def store(self, entries: list):
+        self.connection.executemany("INSERT OR REPLACE INTO records (parser_key, identifier, hash, data) VALUES (?, ?, ?, ?)",
+                                    [(self.parser_key, identifier, record_hash, json.dumps(record, ensure_ascii=False))
+                                     for identifier, record_hash, record in entries])
+        self.connection.commit()
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
@@ -0,0 +1,231 @@
+import json
+import mmap
+import os
+import re
+from array import array
+from pathlib import Path
+import numpy as np
+
+if __name__ == "__main__" or not __package__:
+    from compression import get_compression
+else:
+    from src.compression import get_compression
+
+# Version of the index file layout, indexes written with another version are rebuilt
+INDEX_VERSION = 1
+
+# Kinds of the indexed records
+NO_METADATA = 0  # e.g. records marked as deleted
+MARC = 1
+EDM = 2
+RECORD_FORMATS = {MARC: "marc", EDM: "edm"}
+
+# Start and end tags of records (OAI-PMH or MARC21XML) and EDM objects, with any namespace prefix
+RECORD_TAG_PATTERN = re.compile(rb"<(/?)(?:[A-Za-z_][\w.\-]*:)?(record|ProvidedCHO)(?=[\s/>])")
+# The start tag of the root element
+ROOT_TAG_PATTERN = re.compile(rb"<([A-Za-z_][^\s/>]*)[^>]*>")
+# The XML declaration, processing instructions, comments, doctype and whitespace before the root element
+PROLOG_PATTERN = re.compile(rb"(?:\xef\xbb\xbf)?(?:\s+|<\?.*?\?>|<!--.*?-->|<!DOCTYPE[^>\[]*(?:\[.*?\])?\s*>)*", re.DOTALL)
+# Number of bytes read at a time from streams, e.g. decompressed raw files
+BLOCK_SIZE = 1 << 20
+
+
+class RecordIndex():
+    """
+    The byte offsets of the top-level records of a raw XML file (OAI-PMH records, or MARC21XML records in a plain collection).
+
+    The records can be parsed independently by wrapping their bytes in the start and end tags of the root element
+    (see `wrap`), which carry the namespace declarations of the file.
+
+    Args:
+        starts (np.ndarray): The byte offsets of the start tags of the records.
+        ends (np.ndarray): The byte offsets just after the end tags of the records.
+        kinds (np.ndarray): The content of each record: NO_METADATA, MARC or EDM.
+        root_start (bytes): The start tag of the root element.
+        root_end (bytes): The end tag of the root element.
+
+    Attributes:
+        format (str): The format of the records ('marc' or 'edm'), or None if no record has metadata.
+        num_records (int): The number of records with metadata, like `convert.inspect_records`.
+
+    Methods:
+        ranges():
+            Returns the (start, end) offsets of the records with metadata.
+
+        wrap(record_bytes):
+            Wraps the bytes of a record in the root element so that it can be parsed on its own.
+    """
+
+    def __init__(self, starts, ends, kinds, root_start: bytes, root_end: bytes):
+        self.starts = starts
+        self.ends = ends
+        self.kinds = kinds
+        self.root_start = root_start
+        self.root_end = root_end
+        with_metadata = kinds[kinds != NO_METADATA]
+        self.format = RECORD_FORMATS[int(with_metadata[0])] if len(with_metadata) else None
+        self.num_records = len(with_metadata)
+
+    def ranges(self) -> np.ndarray:
+        mask = self.kinds != NO_METADATA
+        return np.column_stack([self.starts[mask], self.ends[mask]])
+
+    def wrap(self, record_bytes: bytes) -> bytes:
+        return self.root_start + record_bytes + self.root_end
+
+
+def get_index_path(filepath) -> Path:
+    """Returns the path of the record index cached next to a raw XML file."""
+    return Path(f"{filepath}.index.npz")
+
+
+def can_index(filepath) -> bool:
+    """Checks whether a file can be indexed. Compressed files cannot be memory-mapped and are read as streams instead."""
+    return get_compression(filepath) is None
+
+
+def get_file_signature(filepath) -> dict:
+    stat = os.stat(filepath)
+    return {"version": INDEX_VERSION, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def find_root(data):
+    """
+    Finds the root element at the start of XML data. Returns its start tag, its end tag, whether it is an OAI-PMH
+    response and the offset after its start tag, or None if the data does not start with a complete root start tag.
+    """
+    match = ROOT_TAG_PATTERN.match(data, PROLOG_PATTERN.match(data).end())
+    if match is None:
+        return None
+    root_name = match.group(1)
+    # the top-level records of an OAI-PMH response are OAI-PMH records, which hold the metadata in a nested record,
+    # otherwise (e.g. in a MARC21XML collection) they are MARC21XML records themselves
+    is_oai = root_name.split(b":")[-1] == b"OAI-PMH"
+    return match.group(0), b"</" + root_name + b">", is_oai, match.end()
+
+
+def find_records(data, pos: int, is_oai: bool):
+    """
+    Yields the (start, end, kind) of the top-level records of XML data after `pos`, which must not be inside a record.
+
+    Only the record tags are matched, the rest of the data is skipped by the regular expression engine, which is much
+    faster than parsing it. The nesting depth of the record tags tells the top-level records from the MARC21XML
+    records inside OAI-PMH records. Stops at a tag cut off at the end of the data.
+    """
+    depth = 0
+    start = kind = None
+    for match in RECORD_TAG_PATTERN.finditer(data, pos):
+        closing, name = match.group(1), match.group(2)
+        tag_end = data.find(b">", match.end())
+        if tag_end < 0:
+            return
+        if name == b"ProvidedCHO":
+            if depth > 0 and not closing:
+                kind = EDM
+        elif closing:
+            depth -= 1
+            if depth == 0:
+                yield start, tag_end + 1, kind
+        elif data[tag_end - 1:tag_end] == b"/":
+            # empty record
+            continue
+        else:
+            if depth == 0:
+                start = match.start()
+                kind = NO_METADATA if is_oai else MARC
+            elif depth == 1:
+                kind = MARC
+            depth += 1
+
+
+def scan_records(filepath) -> RecordIndex:
+    """Builds the record index of an XML file by scanning the memory-mapped file for the start and end tags of records."""
+    starts, ends, kinds = array("q"), array("q"), array("b")
+    with open(filepath, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError(f"Cannot index an empty file: {filepath}")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            root = find_root(mm)
+            if root is None:
+                raise ValueError(f"No root element found in {filepath}")
+            root_start, root_end, is_oai, pos = root
+            for start, end, kind in find_records(mm, pos, is_oai):
+                starts.append(start)
+                ends.append(end)
+                kinds.append(kind)
+
+    return RecordIndex(np.frombuffer(starts, dtype=np.int64), np.frombuffer(ends, dtype=np.int64),
+                       np.frombuffer(kinds, dtype=np.int8), root_start, root_end)
+
+
+def stream_records(f, block_size: int = BLOCK_SIZE):
+    """
+    Reads the records with metadata of an XML stream (e.g. a compressed raw file opened with `compression.open_raw`)
+    block by block, like `scan_records`. Yields (root start tag, root end tag, record bytes) tuples, with the bytes
+    of each record as they are in the file, so that a record can be parsed and cached the same way as the records
+    of an indexed file. Only the unfinished record at the end of a block is kept in memory.
+    """
+    data = b""
+    root = None
+    while root is None:
+        block = f.read(block_size)
+        data += block
+        root = find_root(data)
+        if root is None and not block:
+            raise ValueError("No root element found")
+    root_start, root_end, is_oai, pos = root
+
+    while True:
+        for start, end, kind in find_records(data, pos, is_oai):
+            if kind != NO_METADATA:
+                yield root_start, root_end, data[start:end]
+            pos = end
+        block = f.read(block_size)
+        if not block:
+            return
+        data = data[pos:] + block
+        pos = 0
+
+
+def save_record_index(filepath, index: RecordIndex) -> None:
+    """Writes the record index of a file next to it, with the size and modification time of the file it belongs to."""
+    index_path = get_index_path(filepath)
+    metadata = json.dumps(get_file_signature(filepath)).encode()
+    tmp_path = index_path.with_suffix(".tmp")
+    try:
+        with open(tmp_path, "wb") as f:
+            np.savez(f, starts=index.starts, ends=index.ends, kinds=index.kinds,
+                     root_start=np.frombuffer(index.root_start, dtype=np.uint8),
+                     root_end=np.frombuffer(index.root_end, dtype=np.uint8),
+                     metadata=np.frombuffer(metadata, dtype=np.uint8))
+        os.replace(tmp_path, index_path)
+    except OSError:
+        # the index is only a cache, e.g. a read-only data directory just means that it is rebuilt next time
+        tmp_path.unlink(missing_ok=True)
+
+
+def read_record_index(filepath) -> RecordIndex:
+    """Reads the cached record index of a file, or returns None if there is none or the file has changed since."""
+    index_path = get_index_path(filepath)
+    if not index_path.exists():
+        return None
+    try:
+        with np.load(index_path) as data:
+            if json.loads(data["metadata"].tobytes()) != get_file_signature(filepath):
+                return None
+            return RecordIndex(data["starts"], data["ends"], data["kinds"],
+                               data["root_start"].tobytes(), data["root_end"].tobytes())
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def get_record_index(filepath) -> RecordIndex:
+    """
+    Returns the record index of an uncompressed XML file, reading it from the cache next to the file
+    or building (and caching) it if the file has not been indexed yet or has changed.
+    """
+    index = read_record_index(filepath)
+    if index is None:
+        index = scan_records(filepath)
+        save_record_index(filepath, index)
+    return index
@@ -0,0 +1,157 @@
+import json
+from pathlib import Path
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Path to the project root
+project_root = Path(__file__).parent.parent
+# Path to the order of the curated columns
+column_order_file_path = project_root / "config" / "marc_columns_order.json"
+
+# Version of the parquet schemas below, to be increased whenever they change
+SCHEMA_VERSION = 1
+# Keys of the schema version and the pipeline stage in the metadata of the parquet files
+SCHEMA_VERSION_KEY = b"enb_curator.schema_version"
+STAGE_KEY = b"enb_curator.stage"
+
+# Compression and row group size of the parquet files: large row groups compress better and are faster to scan
+COMPRESSION = "zstd"
+ROW_GROUP_SIZE = 100_000
+
+# Low-cardinality strings are stored dictionary-encoded (read as pandas categoricals)
+DICTIONARY = pa.dictionary(pa.int32(), pa.string())
+
+# Types of the curated columns that are not plain strings, by their name in config/marc_columns_order.json
+CURATED_COLUMN_TYPES = {
+    "date_entered": pa.timestamp("us"),
+    "publication_date_control": DICTIONARY,
+    "publication_date_cleaned": pa.int32(),
+    "publication_decade": pa.int32(),
+    "publication_place_control": DICTIONARY,
+    "publication_place_harmonized": DICTIONARY,
+    "publication_place_latitude": pa.float64(),
+    "publication_place_longitude": pa.float64(),
+    "publisher_harmonized": DICTIONARY,
+    "publisher_similarity_group": DICTIONARY,
+    "manufacturing_place": DICTIONARY,
+    "edition_n": DICTIONARY,
+    "original_distribution_year": pa.int32(),
+    "original_distribution_place": DICTIONARY,
+    "language": DICTIONARY,
+    "language_additional": DICTIONARY,
+    "language_original": DICTIONARY,
+    "is_fiction": pa.bool_(),
+    "is_posthumous": pa.bool_(),
+    "page_count": pa.int32(),
+    "is_illustrated": pa.bool_(),
+    "physical_size": pa.int32(),
+    "print_run": pa.int64(),
+    "typeface": DICTIONARY,
+    "has_bibliography_register": DICTIONARY,
+    "copyright_status": DICTIONARY,
+    "is_digitized": pa.bool_(),
+    "digitized_year": DICTIONARY,
+    "birth_date": pa.int32(),
+    "death_date": pa.int32(),
+    "gender": DICTIONARY,
+}
+
+
+def get_column_type(inferred_type: pa.DataType, declared_type: pa.DataType = None) -> pa.DataType:
+    """
+    Returns the type of a column: its declared type, or else strings for text and empty columns
+    and lists of strings for list columns (see `convert.get_list_columns`). Other types (e.g. the years of EDM records)
+    are kept as they are.
+    """
+    if declared_type is not None:
+        return declared_type
+    if inferred_type is None or pa.types.is_null(inferred_type) or pa.types.is_string(inferred_type) or pa.types.is_large_string(inferred_type):
+        return pa.string()
+    if pa.types.is_list(inferred_type) or pa.types.is_large_list(inferred_type):
+        return pa.list_(pa.string())
+    return inferred_type
+
+
+def get_schema_metadata(stage: str) -> dict:
+    return {SCHEMA_VERSION_KEY: str(SCHEMA_VERSION).encode(), STAGE_KEY: stage.encode()}
+
+
+def get_converted_schema(inferred_schema: pa.Schema) -> pa.Schema:
+    """
+    Returns the schema of a converted parquet file for the columns of `inferred_schema`: the MARC paths (or Dublin Core
+    elements) are strings, or lists of strings for list columns, whatever type was inferred from the first rows.
+    """
+    fields = [field.with_type(get_column_type(field.type)) for field in inferred_schema]
+    return pa.schema(fields, metadata=get_schema_metadata("converted"))
+
+
+def get_curated_schema(collection_type: str, inferred_schema: pa.Schema = None) -> pa.Schema:
+    """
+    Returns the schema of a curated parquet file: all columns of the collection type ('books' or 'persons')
+    in config/marc_columns_order.json, in that order, with the types in CURATED_COLUMN_TYPES.
+    Columns of `inferred_schema` without a declared type are strings, or lists of strings for list columns.
+    """
+    with open(column_order_file_path, "r", encoding="utf8") as f:
+        column_order = json.load(f)[collection_type]
+    inferred_types = {} if inferred_schema is None else {field.name: field.type for field in inferred_schema}
+    fields = [pa.field(name, get_column_type(inferred_types.get(name), CURATED_COLUMN_TYPES.get(name)))
+              for name in column_order]
+    return pa.schema(fields, metadata=get_schema_metadata(f"curated:{collection_type}"))
+
+
+def get_pandas_dtype(arrow_type: pa.DataType):
+    """Returns the nullable pandas dtype that a column of the given type is read back as, or None to keep the dtype as it is."""
+    if pa.types.is_dictionary(arrow_type):
+        return "category"
+    if pa.types.is_boolean(arrow_type):
+        return "boolean"
+    if pa.types.is_integer(arrow_type):
+        return f"Int{arrow_type.bit_width}"
+    if pa.types.is_floating(arrow_type):
+        return f"Float{arrow_type.bit_width}"
+    if pa.types.is_timestamp(arrow_type):
+        return f"datetime64[{arrow_type.unit}]"
+    return None
+
+
+def dataframe_to_table(df: pd.DataFrame, schema: pa.Schema) -> pa.Table:
+    """
+    Converts a dataframe to an Arrow table with the given schema. Columns of the schema missing from the dataframe are null.
+    The columns are first converted to the nullable pandas dtypes of their types, so that the pandas metadata of the
+    table is the same in every run and the file is always read back with the same dtypes.
+    """
+    df = df.reset_index(drop=True)
+    columns = {}
+    for field in schema:
+        column = df[field.name] if field.name in df.columns else pd.Series(None, index=df.index, dtype=object)
+        dtype = get_pandas_dtype(field.type)
+        columns[field.name] = column if dtype is None else column.astype(dtype)
+    table = pa.Table.from_pandas(pd.DataFrame(columns, index=df.index), preserve_index=False)
+    columns = [table[field.name].cast(field.type) if field.name in table.column_names else pa.nulls(len(table), type=field.type)
+               for field in schema]
+    # the pandas metadata (e.g. nullable integer dtypes) is kept alongside the schema metadata
+    return pa.Table.from_arrays(columns, schema=schema.with_metadata({**(table.schema.metadata or {}), **schema.metadata}))
+
+
+def write_table(table: pa.Table, path) -> None:
+    pq.write_table(table, path, compression=COMPRESSION, row_group_size=ROW_GROUP_SIZE)
+
+
+def write_converted_parquet(df: pd.DataFrame, path) -> None:
+    """Writes a converted dataframe to a parquet file with the converted schema (see `get_converted_schema`)."""
+    inferred_schema = pa.Schema.from_pandas(df, preserve_index=False)
+    write_table(dataframe_to_table(df, get_converted_schema(inferred_schema)), path)
+
+
+def write_curated_parquet(df: pd.DataFrame, path, collection_type: str) -> None:
+    """Writes a curated dataframe to a parquet file with the curated schema of the collection type (see `get_curated_schema`)."""
+    inferred_schema = pa.Schema.from_pandas(df, preserve_index=False)
+    write_table(dataframe_to_table(df, get_curated_schema(collection_type, inferred_schema)), path)
+
+
+def read_schema_version(path) -> int:
+    """Returns the schema version of a parquet file written by the pipeline, or None for files without one."""
+    metadata = pq.read_schema(path).metadata or {}
+    version = metadata.get(SCHEMA_VERSION_KEY)
+    return int(version) if version is not None else None
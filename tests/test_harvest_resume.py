@@ -0,0 +1,69 @@
+"""
+Kills a harvest to parquet mid-run (like a crash or `kill -9`) and checks that resuming it yields every record once.
+The collection is served by the local OAI-PMH stand-in server (benchmarks/oai_server.py).
+"""
+
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+import pandas as pd
+
+# Path to the project root
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / "benchmarks"))
+
+from harvest_benchmark import start_server
+from src import harvest
+
+NUM_RECORDS = 3000
+
+HARVEST_SCRIPT = """
+import sys
+sys.path.insert(0, sys.argv[4])
+from src import harvest
+harvest.harvest_to_parquet(sys.argv[1], sys.argv[3], savepath=sys.argv[2], batch_size=250, verbose=False, checkpoint_every=1)
+"""
+
+
+def wait_for_checkpoint(savepath: Path, min_records: int, timeout: float = 60) -> None:
+    checkpoint_path = harvest.get_checkpoint_path(savepath)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with open(checkpoint_path, "r", encoding="utf8") as f:
+                if json.load(f)["records_written"] >= min_records:
+                    return
+        except (OSError, ValueError):
+            pass
+        time.sleep(0.05)
+    raise TimeoutError(f"No checkpoint with {min_records} records was written")
+
+
+def test_killed_harvest_to_parquet_resumes(tmp_path):
+    server, url = start_server(["--records", str(NUM_RECORDS), "--page-size", "100", "--latency", "0.05"])
+    try:
+        URL = f"{url}?verb=ListRecords&set=benchmark&metadataPrefix=marc21xml"
+        savepath = tmp_path / "benchmark.xml"
+        parquet_path = tmp_path / "benchmark.parquet"
+
+        child = subprocess.Popen([sys.executable, "-c", HARVEST_SCRIPT, URL, str(savepath), str(parquet_path), str(project_root)])
+        try:
+            wait_for_checkpoint(savepath, NUM_RECORDS // 3)
+        finally:
+            child.kill()
+            child.wait()
+        assert not parquet_path.exists()
+
+        harvest.harvest_to_parquet(URL, str(parquet_path), savepath=str(savepath), batch_size=250, verbose=False,
+                                   checkpoint_every=1, resume=True)
+    finally:
+        server.terminate()
+        server.wait()
+
+    df = pd.read_parquet(parquet_path)
+    assert len(df) == NUM_RECORDS
+    assert df["001"].is_unique
+    assert not harvest.get_checkpoint_path(savepath).exists()